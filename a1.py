@@ -0,0 +1,63 @@
+"""
+A1 address codec
+================
+
+Conversions between A1 cell addresses and 1-based ``(row, col)`` numbers,
+shared by the sheet loaders, the spreadsheet app and the formula engine.
+Sheets reuse the same few thousand addresses and column letters over and over,
+so every conversion is memoized.
+"""
+
+import re
+from functools import lru_cache
+
+ADDRESS_CACHE_SIZE = 1 << 16
+
+_ADDRESS_RE = re.compile(r"^\$?([A-Za-z]{1,3})\$?([0-9]+)$")
+COLUMN_RE = re.compile(r"^[A-Z]{1,3}$")
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def column_index(letters):
+    """Convert column letters to a 1-based column number ("A" -> 1, "AA" -> 27)."""
+    idx = 0
+    for ch in letters.upper():
+        idx = idx * 26 + (ord(ch) - 64)
+    return idx
+
+
+@lru_cache(maxsize=None)
+def column_letter(idx):
+    """Convert a 1-based column number to its letters (27 -> "AA")."""
+    letters = ""
+    while idx > 0:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def split_address(address):
+    """Split an A1 address ("B7", "$B$7", "b7") into ``(row, col)`` 1-based numbers, or None."""
+    match = _ADDRESS_RE.match(address)
+    if not match:
+        return None
+    return int(match.group(2)), column_index(match.group(1))
+
+
+def format_address(row, col):
+    """Join 1-based ``(row, col)`` numbers into an A1 address."""
+    return f"{column_letter(col)}{row}"
+
+
+def parse_range(reference):
+    """Parse "A1:K500" (or a single "B7") into ``(row1, col1, row2, col2)``, top-left first.
+
+    Raises ValueError for anything else.
+    """
+    first, _, last = reference.partition(":")
+    start = split_address(first.strip())
+    end = split_address(last.strip()) if last else start
+    if start is None or end is None:
+        raise ValueError(f"Invalid range reference: {reference!r}")
+    return min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]), max(start[1], end[1])
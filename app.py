@@ -1,63 +1,80 @@
+import multiprocessing
 import os
-import json
 from dash import Dash, dcc, html, dash_table, Input, Output, State, ctx, no_update
 import dash_bootstrap_components as dbc
+from logic.sheet_cache import load_sheet, sheet_files
+from logic.sheet_query import query_sheet_window
+from logic.sheet_search import SEARCH_LIMIT, get_index, start_background_index
 
-MAX_ROWS = 30
-MAX_COLS = 10
+PAGE_SIZE = 30
+COL_WINDOW = 10
 
-def load_json_sheets(json_dir):
-    tabs = []
-    files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    for fname in sorted(files):
-        fpath = os.path.join(json_dir, fname)
-        with open(fpath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        cells = data.get("cells", {})
-        rows = []
-        cell_map = {}
-        for cell, cell_data in cells.items():
-            col, row = None, None
-            for i, c in enumerate(cell):
-                if c.isdigit():
-                    col = cell[:i]
-                    row = cell[i:]
-                    break
-            if col and row:
-                if row not in cell_map:
-                    cell_map[row] = {}
-                cell_map[row][col] = cell_data.get("value")
-        all_cols = sorted(list(set(col for row in cell_map.values() for col in row.keys())))
-        if len(all_cols) > MAX_COLS:
-            all_cols = all_cols[:MAX_COLS]
-        row_keys = sorted(cell_map.keys(), key=lambda x: int(x))
-        if len(row_keys) > MAX_ROWS:
-            row_keys = row_keys[:MAX_ROWS]
-        for row_num in row_keys:
-            row_data = {"Row": row_num}
-            for col in all_cols:
-                row_data[col] = cell_map[row_num].get(col)
-            rows.append(row_data)
-        columns = [{"name": "Row", "id": "Row"}] + [{"name": col, "id": col} for col in all_cols]
-        table = dash_table.DataTable(
+JSON_DIR = "data/json_sheets"
+
+# Rendered sheet tables, keyed by source path: path -> (mtime_ns, DataTable)
+_rendered_tables = {}
+
+def sheet_columns(col_letters):
+    return [{"name": "Row", "id": "Row"}] + [{"name": col, "id": col} for col in col_letters]
+
+def make_sheet_table(sheet):
+    # Only the first window is sent here; further pages come from page_sheet_table.
+    all_cols, rows = sheet.window(0, PAGE_SIZE, 0, COL_WINDOW)
+    col_pages = max(1, -(-sheet.column_count // COL_WINDOW))
+    return html.Div([
+        dash_table.DataTable(
+            id="sheet-table",
             data=rows,
-            columns=columns,
-            page_size=10,
+            columns=sheet_columns(all_cols),
+            page_action="custom",
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_count=max(1, -(-sheet.row_count // PAGE_SIZE)),
+            filter_action="custom",
+            filter_query="",
+            filter_options={"case": "insensitive"},
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
             style_table={"overflowX": "auto"},
             style_cell={"textAlign": "left", "maxWidth": "350px"},
             style_header={"fontWeight": "bold", "backgroundColor": "#e9ecef"},
-        )
-        tab_label = fname.replace(".json", "")
-        tabs.append((tab_label, table))
-    return tabs
+        ),
+        dbc.Pagination(
+            id="sheet-col-page",
+            max_value=col_pages,
+            active_page=1,
+            first_last=True,
+            previous_next=True,
+            fully_expanded=False,
+            size="sm",
+            style={"marginTop": "10px", "display": "flex" if col_pages > 1 else "none"},
+        ),
+    ])
 
-def get_json_sheet_names(json_dir="data/json_sheets"):
-    files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
+def render_sheet(sheet_name, json_dir=JSON_DIR):
+    """Build the paged table shell of a single sheet, memoized until its JSON file changes."""
+    path = os.path.join(json_dir, f"{sheet_name}.json")
+    mtime_ns = os.stat(path).st_mtime_ns
+    memo = _rendered_tables.get(path)
+    if memo and memo[0] == mtime_ns:
+        return memo[1]
+    table = make_sheet_table(load_sheet(path))
+    _rendered_tables[path] = (mtime_ns, table)
+    return table
+
+def get_json_sheet_names(json_dir=JSON_DIR):
+    files = sheet_files(json_dir)
     sheet_names = [f.replace(".json", "") for f in files]
     return sheet_names
 
 ALWAYS_VISIBLE = ["RATING", "VERSIONS"]
 
+# The search index of the sheets everyone can read is built at startup, off the
+# request threads (not in the import's worker processes, which re-import logic).
+if multiprocessing.parent_process() is None and os.path.isdir(JSON_DIR):
+    start_background_index(JSON_DIR, ALWAYS_VISIBLE)
+
 PROJECT_FIELDS = [
     ("ID", "proj-id"), ("NAME / CODE", "proj-name"),
     ("MODE", "proj-mode"), ("FUEL", "proj-fuel"),
@@ -115,15 +132,44 @@ def make_action_grid():
         rows.append(row)
     return html.Div(rows)
 
-def get_tabs(visible_sheets, json_dir="data/json_sheets"):
-    json_tabs = load_json_sheets(json_dir)
-    tabs = []
-    for sheet, table in json_tabs:
-        if sheet in visible_sheets:
-            tabs.append(dcc.Tab(label=sheet, value=sheet, children=[html.Div(table)]))
-    return tabs
+def make_search_panel():
+    return dbc.Card(
+        [
+            dbc.CardHeader("SEARCH ALL SHEETS"),
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col(dbc.Input(
+                        id="global-search",
+                        type="search",
+                        placeholder="Parameter, label or value...",
+                        debounce=True,
+                    ), md=8),
+                    dbc.Col(dbc.RadioItems(
+                        id="global-search-mode",
+                        options=[
+                            {"label": "Words", "value": "word"},
+                            {"label": "Prefix", "value": "prefix"},
+                            {"label": "Anywhere", "value": "substring"},
+                        ],
+                        value="word",
+                        inline=True,
+                    ), md=4),
+                ]),
+                html.Div(id="global-search-results", style={"marginTop": "10px"}),
+            ])
+        ], style={"marginBottom": "20px"}
+    )
+
+def get_tabs(visible_sheets, json_dir=JSON_DIR):
+    # Tabs are empty shells; the selected one is rendered by render_selected_tab.
+    available = set(get_json_sheet_names(json_dir))
+    return [
+        dcc.Tab(label=sheet, value=sheet)
+        for sheet in visible_sheets if sheet in available
+    ]
 
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# The sheet table is created by render_selected_tab, after the initial layout.
+app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 
 def get_unlock_options():
     sheets = get_json_sheet_names()
@@ -151,11 +197,15 @@ new_proj_modal = dbc.Modal(
 app.layout = dbc.Container([
     html.H2("ODRIV Dashboard"),
     dcc.Store(id="unlocked-sheets-store", data=[]),
+    make_search_panel(),
     dbc.Row([
         dbc.Col(make_project_settings_panel(), width=4),
         dbc.Col(make_action_grid(), width=8),
     ], style={"marginBottom": "25px"}),
-    html.Div(id="tabs-container"),
+    html.Div(id="tabs-container", children=[
+        dcc.Tabs(id="sheet-tabs", parent_style={"marginTop": "40px"}),
+        html.Div(id="sheet-tab-content"),
+    ]),
     dbc.Button("Configuration Sheet", id="cfg-sheet-btn", color="primary", style={"marginTop": "30px"}),
     dbc.Modal(
         [
@@ -216,25 +266,85 @@ def save_unlocked_sheets(unlock_click, selected_sheets, pwd):
     if unlock_click and selected_sheets and pwd is not None:
         if pwd == "unlock":
             sheets = selected_sheets
+            start_background_index(JSON_DIR, sheets)
         else:
             msg = "Incorrect password!"
     return sheets, msg
 
 @app.callback(
-    Output("tabs-container", "children"),
+    Output("sheet-tabs", "children"),
+    Output("sheet-tabs", "value"),
     Input("unlocked-sheets-store", "data"),
+    State("sheet-tabs", "value"),
 )
-def show_tabs(unlocked_sheets):
+def show_tabs(unlocked_sheets, current_sheet):
     visible_sheets = ALWAYS_VISIBLE.copy()
     if unlocked_sheets:
         visible_sheets += unlocked_sheets
     tabs = get_tabs(visible_sheets)
-    return dcc.Tabs(
-        id="sheet-tabs",
-        value=visible_sheets[0] if visible_sheets else None,
-        children=tabs,
-        parent_style={"marginTop": "40px"},
+    tab_values = [tab.value for tab in tabs]
+    if current_sheet not in tab_values:
+        current_sheet = tab_values[0] if tab_values else None
+    return tabs, current_sheet
+
+@app.callback(
+    Output("sheet-tab-content", "children"),
+    Input("sheet-tabs", "value"),
+)
+def render_selected_tab(sheet_name):
+    if not sheet_name:
+        return None
+    return render_sheet(sheet_name)
+
+@app.callback(
+    Output("sheet-table", "data"),
+    Output("sheet-table", "columns"),
+    Output("sheet-table", "page_count"),
+    Input("sheet-table", "page_current"),
+    Input("sheet-table", "page_size"),
+    Input("sheet-table", "filter_query"),
+    Input("sheet-table", "sort_by"),
+    Input("sheet-col-page", "active_page"),
+    State("sheet-tabs", "value"),
+    prevent_initial_call=True,
+)
+def page_sheet_table(page_current, page_size, filter_query, sort_by, col_page, sheet_name):
+    if not sheet_name:
+        return no_update, no_update, no_update
+    sheet = load_sheet(os.path.join(JSON_DIR, f"{sheet_name}.json"))
+    col_start = ((col_page or 1) - 1) * COL_WINDOW
+    all_cols, rows, page_count = query_sheet_window(
+        sheet, page_current, page_size or PAGE_SIZE, filter_query, sort_by, col_start, COL_WINDOW
     )
+    return rows, sheet_columns(all_cols), page_count
+
+@app.callback(
+    Output("global-search-results", "children"),
+    Input("global-search", "value"),
+    Input("global-search-mode", "value"),
+    State("unlocked-sheets-store", "data"),
+    prevent_initial_call=True,
+)
+def search_all_sheets(query, mode, unlocked_sheets):
+    if not query or not query.strip():
+        return None
+    # Only the sheets the user can open: the always visible ones plus those unlocked.
+    readable = ALWAYS_VISIBLE + list(unlocked_sheets or [])
+    hits = get_index(JSON_DIR).search(query, mode or "word", sheets=readable)
+    if not hits:
+        return html.Div(f"No cell matches \"{query}\".")
+    more = " (first results only)" if len(hits) >= SEARCH_LIMIT else ""
+    return html.Div([
+        html.Small(f"{len(hits)} matching cells{more}"),
+        dash_table.DataTable(
+            data=[{"sheet": sheet, "cell": address, "value": str(value)} for sheet, address, value in hits],
+            columns=[{"name": "Sheet", "id": "sheet"}, {"name": "Cell", "id": "cell"}, {"name": "Value", "id": "value"}],
+            page_size=PAGE_SIZE,
+            style_table={"overflowX": "auto"},
+            style_cell={"textAlign": "left", "maxWidth": "350px"},
+            style_header={"fontWeight": "bold", "backgroundColor": "#e9ecef"},
+        ),
+    ])
 
 # Added: Clear project fields when NEW PROJECT is clicked
 @app.callback(
@@ -1,25 +1,154 @@
-from logic.db import get_conn, get_latest_project_rating
+import os
+import sys
+import threading
+import time
+
+from logic.db import (
+    get_latest_project_rating, get_latest_ratings, get_project_ids, save_project_rating, save_project_ratings,
+)
+from logic.config_loader import get_config
+from logic.scoring import inputs_version, load_model, read_project_results, read_results
+
+# Exported workbook sheets (same folder as app.JSON_DIR)
+SHEETS_DIR = "data/json_sheets"
+
+# Ratings memo shared by every view of a project (tiles, graph, ...): the key is
+# the project, the thresholds it was rated with and the version of the scoring
+# sheets, so a changed config or data drop gives a new key and a recomputation.
+# _cache_lock only guards the dicts; a computation holds the lock of its own
+# key, so ratings of other projects never wait behind it (or its DB calls).
+RATING_CACHE_SIZE = 1024
+_rating_cache = {}
+_key_locks = {}  # key -> Lock while that key is being computed
+_cache_lock = threading.Lock()
 
 def get_thresholds():
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT key, value FROM config")
-        thresholds = {row[0]: float(row[1]) for row in cur.fetchall()}
-    return thresholds
+    # Served from the in-process config cache (see config_loader.get_config).
+    return get_config()
 
-def calculate_project_rating(project_id):
-    thresholds = get_thresholds()
+def _placeholder_rating(project_id, thresholds):
+    # No measurements yet: placeholder score.
     drivability_score = 90 + (project_id % 10)
     status = "GREEN" if drivability_score >= thresholds.get("threshold_green", 90) else \
              "ORANGE" if drivability_score >= thresholds.get("threshold_orange", 75) else "RED"
     warnings = "None" if status == "GREEN" else "Check parameters"
-    from logic.db import save_project_rating
-    save_project_rating(project_id, drivability_score, status, warnings)
     return {
         "drivability_score": drivability_score,
         "status": status,
         "warnings": warnings
     }
 
+def _measured_rating(model, measured, thresholds):
+    rating = model.score(measured, thresholds)
+    return {key: rating[key] for key in ("drivability_score", "status", "warnings")}
+
+def rate_project(project_id, thresholds):
+    # Real scoring once measured ratings are exported to the Résultats sheet:
+    # the project's own rows, or else the sheet-wide ones (see logic.scoring).
+    if os.path.isdir(SHEETS_DIR):
+        results = read_results(SHEETS_DIR, project_id)
+        if results:
+            model = load_model(SHEETS_DIR)
+            return _measured_rating(model, model.align(results), thresholds)
+    return _placeholder_rating(project_id, thresholds)
+
+def _cache_rating(key, rating):
+    with _cache_lock:
+        if len(_rating_cache) >= RATING_CACHE_SIZE:
+            _rating_cache.clear()
+        _rating_cache[key] = rating
+
+def calculate_project_rating(project_id):
+    thresholds = get_thresholds()
+    version = inputs_version(SHEETS_DIR) if os.path.isdir(SHEETS_DIR) else None
+    key = (project_id, tuple(sorted(thresholds.items())), version)
+    rating = _rating_cache.get(key)
+    if rating is None:
+        with _cache_lock:
+            key_lock = _key_locks.setdefault(key, threading.Lock())
+        # Callbacks fired by the same click wait for one computation of this key.
+        with key_lock:
+            rating = _rating_cache.get(key)
+            if rating is None:
+                rating = rate_project(project_id, thresholds)
+                # Only a changed result is written to the ratings history.
+                if get_latest_project_rating(project_id) != rating:
+                    # Wait for the commit: write errors reach the caller, and the next
+                    # read of the latest rating sees this one (no duplicate insert).
+                    save_project_rating(
+                        project_id, rating["drivability_score"], rating["status"], rating["warnings"]
+                    ).result()
+                _cache_rating(key, rating)
+        with _cache_lock:
+            _key_locks.pop(key, None)
+    return dict(rating)
+
 def calculate_all_ratings(project_id):
-    return calculate_project_rating(project_id)
\ No newline at end of file
+    return calculate_project_rating(project_id)
+
+def _rate_chunk(project_ids, thresholds, own, shared):
+    """Rate ``project_ids`` from ratings already computed from Résultats.
+
+    ``own`` maps the projects with rows of their own to their rating and
+    ``shared`` is the rating of the sheet-wide rows (or None).
+    """
+    rated = []
+    for project_id in project_ids:
+        rating = own.get(project_id) or shared
+        rated.append((project_id, dict(rating) if rating else _placeholder_rating(project_id, thresholds)))
+    return rated
+
+def calculate_ratings_batch(project_ids=None, milestone=None):
+    """Rate many projects at once (all projects, or those of ``milestone``, by default).
+
+    Shared inputs (thresholds, scoring model, Résultats, latest stored
+    ratings) are read once, each distinct set of measurements is aligned and
+    scored once, and the ratings that changed are written in a single
+    transaction. Returns ``{project_id: rating}``.
+    """
+    start = time.perf_counter()
+    if project_ids is None:
+        project_ids = get_project_ids(milestone)
+    project_ids = list(project_ids)
+    thresholds = get_thresholds()
+    version = inputs_version(SHEETS_DIR) if os.path.isdir(SHEETS_DIR) else None
+
+    own, shared = {}, None
+    if os.path.isdir(SHEETS_DIR):
+        results = read_project_results(SHEETS_DIR)
+        if results:
+            model = load_model(SHEETS_DIR)
+            wanted = set(project_ids)
+            own = {
+                project: _measured_rating(model, model.align(measurements), thresholds)
+                for project, measurements in results.items()
+                if project is not None and project in wanted
+            }
+            if results.get(None):
+                shared = _measured_rating(model, model.align(results[None]), thresholds)
+    rated = _rate_chunk(project_ids, thresholds, own, shared)
+
+    latest = get_latest_ratings()
+    changed = [
+        (project_id, rating["drivability_score"], rating["status"], rating["warnings"])
+        for project_id, rating in rated
+        if latest.get(project_id) != rating
+    ]
+    if changed:
+        save_project_ratings(changed).result()
+
+    threshold_key = tuple(sorted(thresholds.items()))
+    with _cache_lock:
+        if len(_rating_cache) + len(rated) > RATING_CACHE_SIZE:
+            _rating_cache.clear()
+        for project_id, rating in rated[:RATING_CACHE_SIZE]:
+            _rating_cache[(project_id, threshold_key, version)] = rating
+
+    elapsed = time.perf_counter() - start
+    rate = len(rated) / elapsed if elapsed else 0.0
+    print(f"Rated {len(rated)} projects in {elapsed:.3f}s ({rate:.0f} projects/s), {len(changed)} ratings written")
+    return dict(rated)
+
+if __name__ == "__main__":
+    # python -m logic.calculations [milestone]
+    calculate_ratings_batch(milestone=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,164 @@
+"""
+Normalized sparse cell store
+============================
+
+Keeps every non-empty cell of the workbook sheets in one SQLite table,
+``cells(sheet, row, col, value, formula)``. The table is clustered on
+``(sheet, row, col)`` and has a covering ``(sheet, col, row)`` index, so a
+reference such as ``TARGETS!A1:K500`` or ``RATING!AK18`` is answered with an
+index range scan instead of loading a whole multi-megabyte JSON export.
+
+Usage::
+
+    python -m logic.cell_store <json_dir> [db_path]
+"""
+
+import os
+import re
+import sqlite3
+import sys
+
+from logic.a1 import split_address
+from logic.sheet_cache import file_digest, sheet_files
+from logic.sheet_stream import iter_batches, iter_sheet_cells
+
+CELLS_DB_PATH = "cells.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    sheet TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    value,
+    formula TEXT,
+    PRIMARY KEY (sheet, row, col)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cells_sheet_col_row ON cells (sheet, col, row, value, formula);
+CREATE TABLE IF NOT EXISTS sheets (
+    name TEXT PRIMARY KEY,
+    source TEXT,
+    sha1 TEXT,
+    cell_count INTEGER,
+    imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_REFERENCE_RE = re.compile(
+    r"^(?:(?:'(?P<quoted>(?:[^']|'')+)'|(?P<sheet>[^!']+))!)?"
+    r"\$?(?P<c1>[A-Za-z]{1,3})\$?(?P<r1>\d+)(?::\$?(?P<c2>[A-Za-z]{1,3})\$?(?P<r2>\d+))?$"
+)
+
+
+def connect(db_path=CELLS_DB_PATH):
+    """Open the cell store, creating its schema if needed."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_reference(reference, default_sheet=None):
+    """Parse ``Sheet!A1`` / ``'My sheet'!A1:K500`` into ``(sheet, r1, c1, r2, c2)``.
+
+    Rows and columns are 1-based; a single cell gives ``r1 == r2`` and
+    ``c1 == c2``. Raises ValueError for malformed references.
+    """
+    match = _REFERENCE_RE.match(reference.strip())
+    if not match:
+        raise ValueError(f"Invalid cell reference: {reference!r}")
+    if match.group("quoted") is not None:
+        sheet = match.group("quoted").replace("''", "'")
+    else:
+        sheet = match.group("sheet") or default_sheet
+    if sheet is None:
+        raise ValueError(f"No sheet given in reference: {reference!r}")
+    r1, c1 = split_address(match.group("c1").upper() + match.group("r1"))
+    if match.group("c2"):
+        r2, c2 = split_address(match.group("c2").upper() + match.group("r2"))
+    else:
+        r2, c2 = r1, c1
+    return sheet, min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2)
+
+
+def _iter_rows(name, path):
+    for address, value, formula in iter_sheet_cells(path):
+        pos = split_address(address)
+        if pos is not None:
+            yield name, pos[0], pos[1], value, formula
+
+
+def import_sheet(conn, path):
+    """Replace one sheet's cells with the content of its JSON export.
+
+    The export is streamed and written in batches of ``BATCH_SIZE`` cells, so
+    memory stays flat whatever the sheet size. Returns the number of imported
+    cells, or None when the stored copy is already up to date.
+    """
+    sha1 = file_digest(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    row = conn.execute("SELECT sha1 FROM sheets WHERE name=?", (name,)).fetchone()
+    if row and row[0] == sha1:
+        return None
+    count = 0
+    with conn:
+        conn.execute("DELETE FROM cells WHERE sheet=?", (name,))
+        for batch in iter_batches(_iter_rows(name, path)):
+            conn.executemany(
+                "INSERT OR REPLACE INTO cells (sheet, row, col, value, formula) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            count += len(batch)
+        conn.execute(
+            "INSERT OR REPLACE INTO sheets (name, source, sha1, cell_count) VALUES (?, ?, ?, ?)",
+            (name, os.path.abspath(path), sha1, count),
+        )
+    return count
+
+
+def import_json_sheets(json_dir, db_path=CELLS_DB_PATH):
+    """Import every JSON sheet export of a directory, skipping unchanged ones."""
+    conn = connect(db_path)
+    try:
+        for fname in sheet_files(json_dir):
+            count = import_sheet(conn, os.path.join(json_dir, fname))
+            if count is None:
+                print(f"Unchanged: {fname}")
+            else:
+                print(f"Imported {count} cells from {fname}")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def read_cells(conn, reference, default_sheet=None):
+    """Return ``[(row, col, value, formula)]`` for the non-empty cells of a range."""
+    sheet, r1, c1, r2, c2 = parse_reference(reference, default_sheet)
+    return conn.execute(
+        "SELECT row, col, value, formula FROM cells "
+        "WHERE sheet=? AND row BETWEEN ? AND ? AND col BETWEEN ? AND ? ORDER BY row, col",
+        (sheet, r1, r2, c1, c2),
+    ).fetchall()
+
+
+def read_range(conn, reference, default_sheet=None):
+    """Return a range as a dense list of rows, with None for empty cells."""
+    _, r1, c1, r2, c2 = parse_reference(reference, default_sheet)
+    grid = [[None] * (c2 - c1 + 1) for _ in range(r2 - r1 + 1)]
+    for row, col, value, _ in read_cells(conn, reference, default_sheet):
+        grid[row - r1][col - c1] = value
+    return grid
+
+
+def read_cell(conn, reference, default_sheet=None):
+    """Return the value of a single cell, or None when it is empty."""
+    sheet, r1, c1, _, _ = parse_reference(reference, default_sheet)
+    row = conn.execute(
+        "SELECT value FROM cells WHERE sheet=? AND row=? AND col=?", (sheet, r1, c1)
+    ).fetchone()
+    return row[0] if row else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m logic.cell_store <json_dir> [db_path]")
+        sys.exit(1)
+    import_json_sheets(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else CELLS_DB_PATH)
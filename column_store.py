@@ -0,0 +1,190 @@
+"""
+Column arrays
+=============
+
+Keeps the cells of a sheet in column-major (Fortran-ordered) grids, so every
+column is one contiguous array:
+
+* ``numbers``/``mask``: numeric cells as float64 plus a boolean validity mask;
+* ``codes``: text cells as int32 indexes into ``strings``, a pool holding
+  each distinct text once (code 0 is "not text");
+* ``other``: cells holding anything else (booleans, error values), whose
+  values are kept in the ``others`` dict.
+
+A rectangular range is then a few NumPy slices (no copy), and range functions
+such as SUM, AVERAGE, MIN, MAX, COUNT and SUMPRODUCT run as vectorized
+reductions instead of per-cell Python loops. A range holding an ``other``
+cell is left to the per-cell values instead, so booleans and errors behave
+exactly as they do cell by cell (except in COUNT, which skips errors). Text overwritten by later edits
+stays in the pool; it is small next to the grids.
+
+Rows and columns are 1-based, like the cell references of ``formulas``.
+"""
+
+import numpy as np
+
+from logic.a1 import parse_range
+from logic.formulas import ERROR_CODES, RangeValue, is_number
+
+
+def _is_text(value):
+    return isinstance(value, str) and value not in ERROR_CODES
+
+
+class ColumnStore:
+    """Cell values of one sheet as column arrays: numbers with a validity mask, text as pool codes."""
+
+    __slots__ = ("numbers", "mask", "codes", "other", "strings", "others", "_string_ids")
+
+    def __init__(self, rows=0, cols=0):
+        self.numbers = np.zeros((rows, cols), dtype=np.float64, order="F")
+        self.mask = np.zeros((rows, cols), dtype=bool, order="F")
+        self.codes = np.zeros((rows, cols), dtype=np.int32, order="F")
+        self.other = np.zeros((rows, cols), dtype=bool, order="F")
+        self.strings = [None]
+        self.others = {}  # (row, col) -> value of the cells flagged in ``other``
+        self._string_ids = {}
+
+    @classmethod
+    def from_cells(cls, rows, cols, values):
+        """Build a store from parallel sequences of 1-based rows, columns and values."""
+        rows = np.asarray(rows, dtype=np.intp) - 1
+        cols = np.asarray(cols, dtype=np.intp) - 1
+        store = cls(int(rows.max()) + 1 if len(rows) else 0, int(cols.max()) + 1 if len(cols) else 0)
+        number = np.fromiter((is_number(v) for v in values), dtype=bool, count=len(values))
+        store.numbers[rows[number], cols[number]] = [v for v, n in zip(values, number.tolist()) if n]
+        store.mask[rows[number], cols[number]] = True
+        text = np.fromiter((_is_text(v) for v in values), dtype=bool, count=len(values))
+        store.codes[rows[text], cols[text]] = [store.string_id(v) for v in values if _is_text(v)]
+        for row, col, value in zip(rows.tolist(), cols.tolist(), values):
+            if value is not None and not is_number(value) and not _is_text(value):
+                store.other[row, col] = True
+                store.others[(row + 1, col + 1)] = value
+        return store
+
+    @property
+    def shape(self):
+        return self.numbers.shape
+
+    def _grow(self, rows, cols):
+        old_rows, old_cols = self.numbers.shape
+        rows, cols = max(rows, old_rows), max(cols, old_cols)
+        if (rows, cols) == (old_rows, old_cols):
+            return
+        # Grow geometrically so filling a sheet cell by cell stays amortized O(1).
+        if rows > old_rows:
+            rows = max(rows, old_rows * 2)
+        if cols > old_cols:
+            cols = max(cols, old_cols * 2)
+        numbers = np.zeros((rows, cols), dtype=np.float64, order="F")
+        mask = np.zeros((rows, cols), dtype=bool, order="F")
+        codes = np.zeros((rows, cols), dtype=np.int32, order="F")
+        other = np.zeros((rows, cols), dtype=bool, order="F")
+        numbers[:old_rows, :old_cols] = self.numbers
+        mask[:old_rows, :old_cols] = self.mask
+        codes[:old_rows, :old_cols] = self.codes
+        other[:old_rows, :old_cols] = self.other
+        self.numbers, self.mask, self.codes, self.other = numbers, mask, codes, other
+
+    def string_id(self, text):
+        """Pool index of ``text``, adding it to the pool if needed."""
+        code = self._string_ids.get(text)
+        if code is None:
+            code = self._string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return code
+
+    def set(self, row, col, value):
+        """Record a cell value; None clears the cell."""
+        number, text = is_number(value), _is_text(value)
+        other = value is not None and not number and not text
+        if value is not None:
+            if row > self.numbers.shape[0] or col > self.numbers.shape[1]:
+                self._grow(row, col)
+        elif row > self.numbers.shape[0] or col > self.numbers.shape[1]:
+            return
+        self.numbers[row - 1, col - 1] = value if number else 0.0
+        self.mask[row - 1, col - 1] = number
+        self.codes[row - 1, col - 1] = self.string_id(value) if text else 0
+        self.other[row - 1, col - 1] = other
+        if other:
+            self.others[(row, col)] = value
+        else:
+            self.others.pop((row, col), None)
+
+    def value(self, row, col):
+        """Stored value of a cell: a float, a string, a boolean or error value, or None."""
+        if row > self.numbers.shape[0] or col > self.numbers.shape[1]:
+            return None
+        if self.mask[row - 1, col - 1]:
+            return float(self.numbers[row - 1, col - 1])
+        if self.other[row - 1, col - 1]:
+            return self.others[(row, col)]
+        return self.strings[self.codes[row - 1, col - 1]]
+
+    def block(self, row1, col1, row2, col2):
+        """Return ``(numbers, mask)`` for a range.
+
+        Inside the stored grid these are views; parts of the range beyond it
+        are padded with empty cells.
+        """
+        rows, cols = self.numbers.shape
+        if row2 <= rows and col2 <= cols:
+            return (
+                self.numbers[row1 - 1:row2, col1 - 1:col2],
+                self.mask[row1 - 1:row2, col1 - 1:col2],
+            )
+        numbers = np.zeros((row2 - row1 + 1, col2 - col1 + 1), dtype=np.float64, order="F")
+        mask = np.zeros(numbers.shape, dtype=bool, order="F")
+        r2, c2 = min(row2, rows), min(col2, cols)
+        if row1 <= r2 and col1 <= c2:
+            numbers[:r2 - row1 + 1, :c2 - col1 + 1] = self.numbers[row1 - 1:r2, col1 - 1:c2]
+            mask[:r2 - row1 + 1, :c2 - col1 + 1] = self.mask[row1 - 1:r2, col1 - 1:c2]
+        return numbers, mask
+
+    def text_block(self, row1, col1, row2, col2):
+        """Return the ``codes`` of a range (a view inside the stored grid, padded beyond it)."""
+        rows, cols = self.codes.shape
+        if row2 <= rows and col2 <= cols:
+            return self.codes[row1 - 1:row2, col1 - 1:col2]
+        codes = np.zeros((row2 - row1 + 1, col2 - col1 + 1), dtype=np.int32, order="F")
+        r2, c2 = min(row2, rows), min(col2, cols)
+        if row1 <= r2 and col1 <= c2:
+            codes[:r2 - row1 + 1, :c2 - col1 + 1] = self.codes[row1 - 1:r2, col1 - 1:c2]
+        return codes
+
+    def _has_other(self, row1, col1, row2, col2):
+        if not self.others:
+            return False
+        rows, cols = self.other.shape
+        return bool(self.other[row1 - 1:min(row2, rows), col1 - 1:min(col2, cols)].any())
+
+    def range_value(self, row1, col1, row2, col2, load_rows=None):
+        """RangeValue of a range over the stored arrays.
+
+        Without ``load_rows`` the raw values are rebuilt from the arrays
+        (numbers as floats, text, booleans and error values). A range holding
+        booleans or error values only gets ``load_rows`` (and the number mask,
+        for COUNT): its aggregates are then computed from the per-cell values,
+        errors included.
+        """
+        numbers, mask = self.block(row1, col1, row2, col2)
+        codes = self.text_block(row1, col1, row2, col2)
+        if load_rows is None:
+            def load_rows():
+                strings = self.strings
+                rows = [
+                    [float(n) if m else strings[c] for n, m, c in zip(*line)]
+                    for line in zip(numbers.tolist(), mask.tolist(), codes.tolist())
+                ]
+                for (row, col), value in self.others.items():
+                    if row1 <= row <= row2 and col1 <= col <= col2:
+                        rows[row - row1][col - col1] = value
+                return rows
+        if self._has_other(row1, col1, row2, col2):
+            return RangeValue(load_rows=load_rows, number_mask=mask)
+        return RangeValue(numbers=numbers, mask=mask, codes=codes, pool=self.strings, load_rows=load_rows)
+
+    def get_range(self, reference):
+        """RangeValue of an A1 range such as "A1:K500" (views of the arrays, no copy)."""
+        return self.range_value(*parse_range(reference))
@@ -1,4 +1,23 @@
-from logic.db import get_dropdown_options
+import sqlite3
+import threading
+import time
+
+from logic.db import get_conn, get_dropdown_options
+
+# In-process cache of the config table. It is reloaded only when the revision
+# counter (bumped by triggers on every config change, see migrations.py) has
+# moved, and the counter itself is read at most once per CONFIG_CHECK_INTERVAL,
+# so the rating hot path normally does not touch SQLite at all.
+DEFAULT_CONFIG = {
+    "threshold_green": 90,
+    "threshold_orange": 75,
+}
+CONFIG_CHECK_INTERVAL = 5.0  # seconds
+
+_config_lock = threading.Lock()
+_config = None
+_config_revision = None
+_config_checked = 0.0
 
 def get_vehicle_options():
     return get_dropdown_options("vehicles")
@@ -6,9 +25,36 @@ def get_vehicle_options():
 def get_milestone_options():
     return get_dropdown_options("milestones")
 
+def _read_revision(conn):
+    try:
+        return conn.execute("SELECT revision FROM config_revision WHERE id = 1").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None  # database not migrated yet: reload on every check
+
+def _load_config(conn):
+    config = dict(DEFAULT_CONFIG)
+    for key, value in conn.execute("SELECT key, value FROM config").fetchall():
+        try:
+            config[key] = float(value)
+        except (TypeError, ValueError):
+            config[key] = value
+    return config
+
 def get_config():
-    # Expand as needed, e.g., to fetch config or thresholds
-    return {
-        "threshold_green": 90,
-        "threshold_orange": 75,
-    }
\ No newline at end of file
+    global _config, _config_revision, _config_checked
+    now = time.monotonic()
+    if _config is None or now - _config_checked >= CONFIG_CHECK_INTERVAL:
+        with _config_lock:
+            if _config is None or now - _config_checked >= CONFIG_CHECK_INTERVAL:
+                conn = get_conn()
+                revision = _read_revision(conn)
+                if _config is None or revision is None or revision != _config_revision:
+                    _config = _load_config(conn)
+                    _config_revision = revision
+                _config_checked = now
+    return dict(_config)
+
+def invalidate_config():
+    # Force a revision check on the next get_config() (e.g. right after editing config).
+    global _config_checked
+    _config_checked = 0.0
@@ -1,15 +1,164 @@
 import sqlite3
+import threading
+import queue
+from concurrent.futures import Future
 from pathlib import Path
 import os
 
+from logic.migrations import migrate
+
 DB_PATH = Path(os.path.dirname(os.path.abspath(__file__))).parent / "data" / "odriv.db"
 print(f"DB_PATH resolved to: {DB_PATH}")
 
 if not DB_PATH.exists():
     raise FileNotFoundError(f"SQLite DB missing at {DB_PATH}")
 
-def get_conn():
-    return sqlite3.connect(DB_PATH)
+# Connection tuning: WAL lets readers run while a writer commits, NORMAL sync is
+# durable enough under WAL, and the page cache / mmap keep hot pages in memory.
+CACHED_STATEMENTS = 256
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # in KiB, i.e. ~16 MB per connection
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_local = threading.local()
+_migrate_lock = threading.Lock()
+_migrated = False
+
+def _connect(db_path=DB_PATH):
+    global _migrated
+    conn = sqlite3.connect(db_path, cached_statements=CACHED_STATEMENTS)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # Bring the runtime database to the current schema once per process.
+    if db_path == DB_PATH and not _migrated:
+        with _migrate_lock:
+            if not _migrated:
+                try:
+                    migrate(conn)
+                except sqlite3.Error as e:
+                    print(f"DB: migrations not applied ({e})")
+                _migrated = True
+    return conn
+
+def get_conn(db_path=None):
+    """Connection of the calling thread, opened and tuned on first use.
+
+    The connection is reused by every later call on the thread, so callbacks
+    keep its page cache and prepared statements. ``with get_conn() as conn``
+    still commits (or rolls back) the transaction but does not close it.
+    ``db_path`` selects another database (e.g. the dashboard's sheet tables),
+    tuned the same way but not migrated.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        # New thread, or a forked worker that must not share the parent's handles.
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    db_path = DB_PATH if db_path is None else db_path
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = _connect(db_path)
+    return conn
+
+def close_conn():
+    """Close the calling thread's connections (e.g. when a worker thread ends)."""
+    conns = getattr(_local, "conns", None) or {}
+    _local.conns = {}
+    for conn in conns.values():
+        conn.close()
+
+# --- Single writer ------------------------------------------------------------
+# All inserts go through one background thread, so request threads never
+# compete for the SQLite write lock. Pending writes are committed together in
+# one transaction, and when a project has several ratings waiting only the
+# newest one is written.
+
+WRITE_BATCH_SIZE = 500
+
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer = None
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="odriv-db-writer", daemon=True)
+            _writer.start()
+
+def submit_write(kind, params):
+    """Queue a write (``"project"``, ``"rating"`` or ``"ratings"``); returns a Future.
+
+    The Future gives the new row id of a project, None for a rating and the
+    number of rows for a list of ratings.
+    """
+    future = Future()
+    _write_queue.put((kind, params, future))
+    _ensure_writer()
+    return future
+
+def flush_writes():
+    """Block until every write queued so far is committed."""
+    submit_write("flush", None).result()
+
+def _writer_loop():
+    while True:
+        batch = [_write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            # Never leave a caller waiting, and keep the writer thread alive.
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+def _write_batch(batch):
+    ratings = {}  # project_id -> (params, futures), the newest rating wins
+    results = []
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            for kind, params, future in batch:
+                if kind == "project":
+                    cur.execute(
+                        "INSERT INTO projects (name, vehicle, milestone, user) VALUES (?, ?, ?, ?)",
+                        params
+                    )
+                    results.append((future, cur.lastrowid))
+                elif kind == "rating":
+                    _, futures = ratings.pop(params[0], (None, []))
+                    ratings[params[0]] = (params, futures + [future])
+                elif kind == "ratings":
+                    for row in params:
+                        _, futures = ratings.pop(row[0], (None, []))
+                        ratings[row[0]] = (row, futures)
+                    results.append((future, len(params)))
+                else:
+                    results.append((future, None))
+            cur.executemany(
+                "INSERT INTO project_ratings (project_id, drivability_score, status, warnings) VALUES (?, ?, ?, ?)",
+                [params for params, _ in ratings.values()]
+            )
+    except Exception as e:
+        print(f"DB writer: batch of {len(batch)} writes failed: {e}")
+        for _, _, future in batch:
+            future.set_exception(e)
+        return
+    for future, rowid in results:
+        future.set_result(rowid)
+    for _, futures in ratings.values():
+        for future in futures:
+            future.set_result(None)
 
 def get_projects():
     with get_conn() as conn:
@@ -21,14 +170,21 @@ def get_projects():
         ]
 
 def add_project(name, vehicle, milestone, user):
+    # Waits for the writer so the caller gets the new id, as before.
+    return submit_write("project", (name, vehicle, milestone, user)).result()
+
+def get_project_ids(milestone=None):
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO projects (name, vehicle, milestone, user) VALUES (?, ?, ?, ?)",
-            (name, vehicle, milestone, user)
-        )
-        conn.commit()
-        return cur.lastrowid
+        if milestone is None:
+            cur.execute("SELECT id FROM projects ORDER BY id")
+        else:
+            cur.execute("SELECT id FROM projects WHERE milestone=? ORDER BY id", (milestone,))
+        return [row[0] for row in cur.fetchall()]
+
+def save_project_ratings(rows):
+    # rows: [(project_id, drivability_score, status, warnings)], written in one transaction.
+    return submit_write("ratings", list(rows))
 
 def get_project_details(project_id):
     with get_conn() as conn:
@@ -53,13 +209,8 @@ def get_dropdown_options(table):
         return [{"label": row[0], "value": row[0]} for row in cur.fetchall()]
 
 def save_project_rating(project_id, drivability_score, status, warnings):
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO project_ratings (project_id, drivability_score, status, warnings) VALUES (?, ?, ?, ?)",
-            (project_id, drivability_score, status, warnings)
-        )
-        conn.commit()
+    # Queued; the returned Future raises the write error, if any (call .result() to wait).
+    return submit_write("rating", (project_id, drivability_score, status, warnings))
 
 def get_latest_project_rating(project_id):
     with get_conn() as conn:
@@ -71,4 +222,25 @@ def get_latest_project_rating(project_id):
         row = cur.fetchone()
         if row:
             return {"drivability_score": row[0], "status": row[1], "warnings": row[2]}
-        return {}
\ No newline at end of file
+        return {}
+
+def get_latest_ratings():
+    # One row per project from the trigger-maintained project_latest_rating table.
+    with get_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                "SELECT l.project_id, r.drivability_score, r.status, r.warnings "
+                "FROM project_latest_rating l JOIN project_ratings r ON r.id = l.rating_id"
+            )
+        except sqlite3.OperationalError:
+            # Database not migrated (e.g. read-only): newest rating per project directly.
+            cur.execute(
+                "SELECT r.project_id, r.drivability_score, r.status, r.warnings FROM project_ratings r "
+                "JOIN (SELECT MAX(id) AS id FROM project_ratings WHERE project_id IS NOT NULL "
+                "GROUP BY project_id) l ON r.id = l.id"
+            )
+        return {
+            row[0]: {"drivability_score": row[1], "status": row[2], "warnings": row[3]}
+            for row in cur.fetchall()
+        }
@@ -4,12 +4,19 @@ Phase 1: Basic spreadsheet with cell editing, values, and simple formulas
 """
 
 import dash
-from dash import Dash, html, dcc, dash_table, Input, Output, State, ALL, ctx
+from dash import Dash, html, dcc, dash_table, Input, Output, State, ALL, ctx, Patch
 import dash_bootstrap_components as dbc
 import json
-import re
 from typing import Dict, Any, List, Tuple
 
+from logic.formulas import (
+    CellRef, RangeRef, NameRef, RangeValue, FormulaError, FormulaSyntaxError, ERROR_CODES,
+    compile_formula,
+)
+from logic.column_store import ColumnStore
+from logic.recalc import CYCLE_ERROR, DependencyGraph
+from logic.a1 import column_letter, split_address
+
 # Initialize the Dash app
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
@@ -19,92 +26,206 @@ NUM_COLS = 26  # A-Z
 COLUMN_LETTERS = [chr(65 + i) for i in range(NUM_COLS)]
 
 
+def parse_input(value: Any) -> Any:
+    """Turn typed cell text into a number when it looks like one (as Excel does)"""
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+    return value
+
+
+def is_formula(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith('=')
+
+
+def cell_precedents(formula: str) -> set:
+    """Cell refs (e.g. "A1") a formula reads on this sheet, with ranges expanded"""
+    refs = set()
+    for ref in compile_formula(formula).refs:
+        if ref.sheet is not None or isinstance(ref, NameRef):
+            continue
+        if isinstance(ref, CellRef):
+            refs.add(f"{column_letter(ref.col)}{ref.row}")
+        else:
+            for col in range(ref.col1, ref.col2 + 1):
+                letters = column_letter(col)
+                refs.update(f"{letters}{row}" for row in range(ref.row1, ref.row2 + 1))
+    return refs
+
+
+class SheetContext:
+    """Resolves formula references against the cell_data store of the sheet.
+
+    Formula cells are read from their stored 'result' when present. Otherwise
+    they are evaluated on the fly (memoized, with cycle detection). Numeric
+    values are also kept in column arrays so range functions run vectorized.
+    """
+
+    def __init__(self, cell_data: Dict[str, Any]):
+        self.cell_data = cell_data
+        self.caller = None
+        self._computed = {}
+        self._visiting = set()
+        self._pending = set()  # (row, col) of formula cells without a result yet
+        self._memo = {}
+        self.columns = ColumnStore(NUM_ROWS, NUM_COLS)
+        for cell_ref, entry in cell_data.items():
+            pos = split_address(cell_ref)
+            if pos is None:
+                continue
+            value = entry.get('value', '')
+            if not is_formula(value):
+                self.columns.set(*pos, parse_input(value))
+            elif 'result' in entry:
+                self.columns.set(*pos, entry['result'])
+            else:
+                self._pending.add(pos)
+
+    def set_result(self, cell_ref: str, result: Any) -> None:
+        """Store a formula result in cell_data and in the column arrays"""
+        self.cell_data[cell_ref]['result'] = result
+        self._record(cell_ref, result)
+
+    def _record(self, cell_ref: str, result: Any) -> None:
+        pos = split_address(cell_ref)
+        self._pending.discard(pos)
+        self.columns.set(*pos, result)
+
+    def cell(self, ref: CellRef) -> Any:
+        if ref.sheet is not None:
+            raise FormulaError("#REF!")
+        cell_ref = f"{column_letter(ref.col)}{ref.row}"
+        entry = self.cell_data.get(cell_ref, {})
+        value = entry.get('value', '')
+        if not is_formula(value):
+            return None if value == '' else parse_input(value)
+        if 'result' in entry:
+            result = entry['result']
+        elif cell_ref in self._computed:
+            result = self._computed[cell_ref]
+        else:
+            if cell_ref in self._visiting:
+                raise FormulaError(CYCLE_ERROR)
+            self._visiting.add(cell_ref)
+            try:
+                result = evaluate_formula(value, self, cell_ref)
+            finally:
+                self._visiting.discard(cell_ref)
+            self._computed[cell_ref] = result
+            self._record(cell_ref, result)
+        # Errors propagate to the formulas that read them
+        if isinstance(result, str) and result in ERROR_CODES:
+            raise FormulaError(result)
+        return result
+
+    def memo(self, ref) -> Dict[Any, Any]:
+        """Derived data of formula functions, kept for the life of this context"""
+        return self._memo
+
+    def range(self, ref: RangeRef) -> RangeValue:
+        if ref.sheet is not None:
+            raise FormulaError("#REF!")
+        # Formulas inside the range that have no result yet are evaluated first
+        for row, col in [
+            pos for pos in self._pending
+            if ref.row1 <= pos[0] <= ref.row2 and ref.col1 <= pos[1] <= ref.col2
+        ]:
+            try:
+                self.cell(CellRef(None, None, row, col))
+            except FormulaError:
+                pass  # recorded in the arrays; the functions reading it decide
+        return self.columns.range_value(
+            ref.row1, ref.col1, ref.row2, ref.col2,
+            load_rows=lambda: [
+                [self.cell(CellRef(None, None, row, col)) for col in range(ref.col1, ref.col2 + 1)]
+                for row in range(ref.row1, ref.row2 + 1)
+            ],
+        )
+
+    def name(self, ref: NameRef) -> Any:
+        raise FormulaError("#NAME?")
+
+
+def evaluate_formula(formula: str, context: SheetContext, cell_ref: str = None) -> Any:
+    """Evaluate a formula (of cell_ref, when given); errors are returned as their Excel error code"""
+    previous = context.caller
+    if cell_ref is not None:
+        row, col = split_address(cell_ref)
+        context.caller = CellRef(None, None, row, col)
+    try:
+        return compile_formula(formula).evaluate(context)
+    except FormulaError as e:
+        return e.code
+    except FormulaSyntaxError as e:
+        return f"#ERROR: {str(e)}"
+    finally:
+        context.caller = previous
+
+
+def build_dependency_graph(cell_data: Dict[str, Any]) -> DependencyGraph:
+    """Dependency graph of all formula cells of the sheet"""
+    graph = DependencyGraph()
+    for cell_ref, entry in cell_data.items():
+        value = entry.get('value')
+        if is_formula(value):
+            try:
+                graph.set_precedents(cell_ref, cell_precedents(value))
+            except FormulaSyntaxError:
+                graph.set_precedents(cell_ref, ())
+    return graph
+
+
+def recalculate(cell_data: Dict[str, Any], changed=None) -> set:
+    """
+    Recalculate formula cells and store their 'result' in cell_data.
+    With changed=None every formula is recalculated, otherwise only the cells
+    downstream of the changed ones. Returns the set of recalculated cell refs.
+    """
+    graph = build_dependency_graph(cell_data)
+    if changed is None:
+        dirty = set(graph.precedents)
+    else:
+        dirty = graph.downstream(changed)
+    dirty = {ref for ref in dirty if is_formula(cell_data.get(ref, {}).get('value'))}
+    for ref in dirty:
+        cell_data[ref].pop('result', None)
+
+    order, cyclic = graph.recalc_order(dirty)
+    context = SheetContext(cell_data)
+    for ref in cyclic:
+        context.set_result(ref, CYCLE_ERROR)
+    for ref in order:
+        context.set_result(ref, evaluate_formula(cell_data[ref]['value'], context, ref))
+    return dirty
+
+
+def display_value(entry: Dict[str, Any]) -> Any:
+    """Value shown in the grid for a cell_data entry (formulas show results)"""
+    if 'result' in entry:
+        result = entry['result']
+        return round(result, 2) if isinstance(result, float) else result
+    return entry.get('value', '')
+
+
 class FormulaEvaluator:
-    """Evaluates simple Excel-like formulas"""
+    """Evaluates Excel-like formulas"""
     
     @staticmethod
     def evaluate(formula: str, cell_data: Dict[str, Any]) -> Any:
         """
         Evaluate a formula string
-        Supported: =SUM(A1:A5), =AVERAGE(B1:B10), =A1+B1, =A1*2, etc.
+        Supported: =SUM(A1:A5), =AVERAGE(B1:B10), =A1+B1, =A1*2, =IF(A1>5,"yes","no"), etc.
+        Formulas are compiled once per distinct text (see formulas.compile_formula).
         """
-        if not formula or not formula.startswith('='):
+        if not is_formula(formula):
             return formula
-        
-        formula = formula[1:]  # Remove '=' prefix
-        
-        try:
-            # Handle SUM function
-            sum_pattern = r'SUM\(([A-Z]+\d+):([A-Z]+\d+)\)'
-            sum_match = re.search(sum_pattern, formula, re.IGNORECASE)
-            if sum_match:
-                start_cell = sum_match.group(1).upper()
-                end_cell = sum_match.group(2).upper()
-                values = FormulaEvaluator._get_range_values(start_cell, end_cell, cell_data)
-                return sum(values)
-            
-            # Handle AVERAGE function
-            avg_pattern = r'AVERAGE\(([A-Z]+\d+):([A-Z]+\d+)\)'
-            avg_match = re.search(avg_pattern, formula, re.IGNORECASE)
-            if avg_match:
-                start_cell = avg_match.group(1).upper()
-                end_cell = avg_match.group(2).upper()
-                values = FormulaEvaluator._get_range_values(start_cell, end_cell, cell_data)
-                return sum(values) / len(values) if values else 0
-            
-            # Handle cell references in arithmetic expressions
-            cell_pattern = r'([A-Z]+\d+)'
-            cells_in_formula = re.findall(cell_pattern, formula)
-            
-            for cell_ref in cells_in_formula:
-                cell_value = cell_data.get(cell_ref, {}).get('value', 0)
-                # If the cell contains a formula, evaluate it first
-                if isinstance(cell_value, str) and cell_value.startswith('='):
-                    cell_value = FormulaEvaluator.evaluate(cell_value, cell_data)
-                # Convert to number if possible
-                try:
-                    cell_value = float(cell_value) if cell_value else 0
-                except (ValueError, TypeError):
-                    cell_value = 0
-                formula = formula.replace(cell_ref, str(cell_value))
-            
-            # Evaluate the arithmetic expression
-            result = eval(formula)
-            return round(result, 2) if isinstance(result, float) else result
-            
-        except Exception as e:
-            return f"#ERROR: {str(e)}"
-    
-    @staticmethod
-    def _get_range_values(start_cell: str, end_cell: str, cell_data: Dict[str, Any]) -> List[float]:
-        """Get numeric values from a cell range"""
-        start_col = ''.join(filter(str.isalpha, start_cell))
-        start_row = int(''.join(filter(str.isdigit, start_cell)))
-        end_col = ''.join(filter(str.isalpha, end_cell))
-        end_row = int(''.join(filter(str.isdigit, end_cell)))
-        
-        start_col_idx = ord(start_col) - ord('A')
-        end_col_idx = ord(end_col) - ord('A')
-        
-        values = []
-        for row in range(start_row, end_row + 1):
-            for col_idx in range(start_col_idx, end_col_idx + 1):
-                col = chr(ord('A') + col_idx)
-                cell_ref = f"{col}{row}"
-                cell_value = cell_data.get(cell_ref, {}).get('value', '')
-                
-                # If it's a formula, evaluate it
-                if isinstance(cell_value, str) and cell_value.startswith('='):
-                    cell_value = FormulaEvaluator.evaluate(cell_value, cell_data)
-                
-                # Convert to number
-                try:
-                    if cell_value:
-                        values.append(float(cell_value))
-                except (ValueError, TypeError):
-                    pass
-        
-        return values
+        result = evaluate_formula(formula, SheetContext(cell_data))
+        return round(result, 2) if isinstance(result, float) else result
 
 
 def create_empty_spreadsheet():
@@ -118,6 +239,50 @@ def create_empty_spreadsheet():
     return data
 
 
+def display_rows(data, cell_data):
+    """Grid rows as shown in the table (formulas show their results)"""
+    display_data = []
+    for row_dict in data:
+        display_row = {'row': row_dict['row']}
+        for col in COLUMN_LETTERS:
+            cell_ref = f"{col}{row_dict['row']}"
+            # Formulas show their calculated result (see recalculate)
+            display_row[col] = display_value(cell_data.get(cell_ref, {}))
+        display_data.append(display_row)
+    return display_data
+
+
+def edited_cells(table_data, previous_data, active_cell=None) -> Dict[str, Any]:
+    """Return {cell_ref: new_value} for the cells that differ from previous_data.
+
+    The row of the active cell is checked first (a normal edit touches only
+    that cell); the other rows are compared only when it holds no change,
+    e.g. after a paste.
+    """
+    if not previous_data or len(previous_data) != len(table_data):
+        return {
+            f"{col}{row_dict.get('row')}": row_dict.get(col, '')
+            for row_dict in table_data
+            for col in COLUMN_LETTERS
+        }
+    def changes_in(indexes):
+        changes = {}
+        for index in indexes:
+            row_dict, previous = table_data[index], previous_data[index]
+            if row_dict == previous:
+                continue
+            for col in COLUMN_LETTERS:
+                if row_dict.get(col, '') != previous.get(col, ''):
+                    changes[f"{col}{row_dict.get('row')}"] = row_dict.get(col, '')
+        return changes
+
+    if active_cell and active_cell.get('row') is not None and active_cell['row'] < len(table_data):
+        changes = changes_in([active_cell['row']])
+        if changes:
+            return changes
+    return changes_in(range(len(table_data)))
+
+
 def create_spreadsheet_table(data, cell_data):
     """Create the spreadsheet table component"""
     columns = [{'name': 'Row', 'id': 'row', 'editable': False, 'type': 'text'}]
@@ -126,21 +291,7 @@ def create_spreadsheet_table(data, cell_data):
         for col in COLUMN_LETTERS
     ])
     
-    # Calculate display values (formulas show results)
-    display_data = []
-    for row_dict in data:
-        display_row = {'row': row_dict['row']}
-        for col in COLUMN_LETTERS:
-            cell_ref = f"{col}{row_dict['row']}"
-            cell_value = cell_data.get(cell_ref, {}).get('value', '')
-            
-            # If it's a formula, show the calculated result
-            if isinstance(cell_value, str) and cell_value.startswith('='):
-                calculated = FormulaEvaluator.evaluate(cell_value, cell_data)
-                display_row[col] = calculated
-            else:
-                display_row[col] = cell_value
-        display_data.append(display_row)
+    display_data = display_rows(data, cell_data)
     
     return dash_table.DataTable(
         id='spreadsheet-table',
@@ -244,6 +395,7 @@ app.layout = dbc.Container([
                 html.Li("Arithmetic: +, -, *, / (e.g., =A1*2)"),
                 html.Li("SUM function: =SUM(A1:A10)"),
                 html.Li("AVERAGE function: =AVERAGE(B1:B5)"),
+                html.Li("Also: MIN, MAX, COUNT, COUNTA, SUMPRODUCT, ROUND, ABS, LEN, IF, IFERROR, AND, OR, NOT"),
                 html.Li("Cell references: =A1+B2*C3"),
             ]),
             html.H6("Examples:"),
@@ -259,26 +411,28 @@ app.layout = dbc.Container([
 ], fluid=True)
 
 
-# Callback to update cell data when table is edited
+# Callback to update cell data when table is edited.
+# Edits are answered with Patch updates that touch only the edited cells and
+# their recalculated dependents, so the payload does not grow with the grid.
 @app.callback(
     Output('cell-data-store', 'data'),
-    Output('spreadsheet-container', 'children'),
+    Output('spreadsheet-table', 'data'),
     Output('status-bar', 'children'),
     Input('spreadsheet-table', 'data'),
-    Input('spreadsheet-table', 'active_cell'),
     Input('btn-clear', 'n_clicks'),
     Input('btn-sample', 'n_clicks'),
+    State('spreadsheet-table', 'data_previous'),
+    State('spreadsheet-table', 'active_cell'),
     State('cell-data-store', 'data'),
     prevent_initial_call=True
 )
-def update_spreadsheet(table_data, active_cell, clear_clicks, sample_clicks, cell_data):
+def update_spreadsheet(table_data, clear_clicks, sample_clicks, previous_data, active_cell, cell_data):
     """Update spreadsheet when cells are edited or buttons clicked"""
     trigger = ctx.triggered_id
     
     # Clear sheet
     if trigger == 'btn-clear':
-        empty_data = create_empty_spreadsheet()
-        return {}, [create_spreadsheet_table(empty_data, {})], \
+        return {}, create_empty_spreadsheet(), \
                dbc.Alert("Sheet cleared!", color="success", className="mb-0")
     
     # Load sample data
@@ -298,30 +452,43 @@ def update_spreadsheet(table_data, active_cell, clear_clicks, sample_clicks, cel
             'C5': {'value': '=SUM(A1:A5)'},
             'C6': {'value': '=AVERAGE(A1:A5)'},
         }
-        empty_data = create_empty_spreadsheet()
-        return sample_cell_data, [create_spreadsheet_table(empty_data, sample_cell_data)], \
+        recalculate(sample_cell_data)
+        return sample_cell_data, display_rows(create_empty_spreadsheet(), sample_cell_data), \
                dbc.Alert("Sample data loaded! See columns A, B, C", color="success", className="mb-0")
     
     # Update cell data from table edits
     if trigger == 'spreadsheet-table' and table_data:
-        # Extract changes
-        for row_dict in table_data:
-            row_num = row_dict.get('row')
-            for col in COLUMN_LETTERS:
-                cell_ref = f"{col}{row_num}"
-                cell_value = row_dict.get(col, '')
-                
-                if cell_value:
-                    cell_data[cell_ref] = {'value': cell_value}
-                elif cell_ref in cell_data:
-                    del cell_data[cell_ref]
+        # Extract changes: a cell changed when the grid no longer shows its display value
+        changed = set()
+        for cell_ref, cell_value in edited_cells(table_data, previous_data, active_cell).items():
+            if cell_value == display_value(cell_data.get(cell_ref, {})):
+                continue
+            changed.add(cell_ref)
+            if cell_value:
+                cell_data[cell_ref] = {'value': cell_value}
+            elif cell_ref in cell_data:
+                del cell_data[cell_ref]
+        if not changed:
+            return dash.no_update, dash.no_update, dash.no_update
         
-        # Recreate table with updated data
-        empty_data = create_empty_spreadsheet()
-        return cell_data, [create_spreadsheet_table(empty_data, cell_data)], \
-               dbc.Alert("Spreadsheet updated!", color="success", className="mb-0")
+        # Only the formulas downstream of the edited cells are recalculated
+        dirty = recalculate(cell_data, changed)
+        
+        # Send back only the cells that changed
+        store_patch = Patch()
+        table_patch = Patch()
+        for cell_ref in changed | dirty:
+            if cell_ref in cell_data:
+                store_patch[cell_ref] = cell_data[cell_ref]
+            else:
+                del store_patch[cell_ref]
+            row, col = split_address(cell_ref)
+            table_patch[row - 1][column_letter(col)] = display_value(cell_data.get(cell_ref, {}))
+        return store_patch, table_patch, \
+               dbc.Alert(f"Spreadsheet updated! {len(changed | dirty)} cell(s) changed.",
+                         color="success", className="mb-0")
     
-    return cell_data, dash.no_update, dash.no_update
+    return dash.no_update, dash.no_update, dash.no_update
 
 
 # Callback to export data
@@ -352,6 +519,6 @@ if __name__ == '__main__':
     print("\nFeatures:")
     print("- Edit cells by clicking on them")
     print("- Enter formulas starting with = (e.g., =A1+B1)")
-    print("- Supported functions: SUM, AVERAGE")
+    print("- Supported functions: SUM, AVERAGE, MIN, MAX, COUNT, IF, ROUND, ...")
     print("- Try the 'Sample Data' button for examples")
     app.run(debug=True, port=8050)
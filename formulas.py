@@ -0,0 +1,669 @@
+"""
+Formula compiler
+================
+
+Tokenizes and parses Excel-style formulas (``=SUM(A1:A5)*2``,
+``=IF(LEN([1]HOME!Project)>0,[1]HOME!Project,"")`` ...) and compiles each one
+into a tree of Python closures. Compilation is cached by formula text, so a
+formula that appears in many cells, or is recalculated many times, is parsed
+once and afterwards only costs the closure calls.
+
+A compiled formula is evaluated against a context object providing::
+
+    ctx.cell(ref)   -> value of a CellRef
+    ctx.range(ref)  -> RangeValue for a RangeRef
+    ctx.name(ref)   -> value of a NameRef (named range)
+    ctx.caller      -> CellRef of the formula being evaluated, or None
+
+Errors are raised as FormulaError carrying the Excel error code
+(``#DIV/0!``, ``#VALUE!``, ``#NAME?``, ``#REF!`` ...).
+"""
+
+import datetime
+import math
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from logic.a1 import column_index
+
+FORMULA_CACHE_SIZE = 4096
+
+
+ERROR_CODES = frozenset(
+    ("#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A", "#CYCLE!")
+)
+
+
+class FormulaError(Exception):
+    """An Excel error value raised during evaluation (e.g. ``#DIV/0!``)."""
+
+    def __init__(self, code, message=None):
+        super().__init__(message or code)
+        self.code = code
+
+
+class FormulaSyntaxError(ValueError):
+    """The formula text could not be parsed."""
+
+
+# --- References --------------------------------------------------------------
+
+# ``book`` is the external workbook index of ``[1]Sheet!A1`` (None when absent),
+# ``sheet`` is None for references to the formula's own sheet. Rows and columns
+# are 1-based.
+CellRef = namedtuple("CellRef", "book sheet row col")
+RangeRef = namedtuple("RangeRef", "book sheet row1 col1 row2 col2")
+NameRef = namedtuple("NameRef", "book sheet name")
+
+
+class RangeValue:
+    """The values of a rectangular range.
+
+    ``numeric()`` returns ``(numbers, mask)`` float64/bool arrays of the range
+    shape (non-numeric cells are 0 and masked out), which is what the range
+    aggregates work on. ``text_codes()`` returns ``(codes, pool)``: an int32
+    array where text cells hold their index in the ``pool`` list (0 for
+    other cells, ``pool[0]`` is None). Contexts backed by column arrays pass
+    these in directly and only materialize ``rows`` (the raw values) when a
+    function needs them. ``number_mask()`` tells which cells hold numbers
+    without reading error cells; a context can pass it alone for a range
+    whose values must otherwise come from ``rows``.
+    """
+
+    __slots__ = ("_rows", "_load_rows", "_numbers", "_mask", "_codes", "_pool", "_number_mask")
+
+    def __init__(self, rows=None, numbers=None, mask=None, load_rows=None, codes=None, pool=None,
+                 number_mask=None):
+        self._rows = rows
+        self._load_rows = load_rows
+        self._numbers = numbers
+        self._mask = mask
+        self._codes = codes
+        self._pool = pool
+        self._number_mask = number_mask
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self._load_rows()
+        return self._rows
+
+    def values(self):
+        for row in self.rows:
+            yield from row
+
+    def numeric(self):
+        if self._numbers is None:
+            rows = self.rows
+            self._mask = np.array([[is_number(v) for v in row] for row in rows], dtype=bool).reshape(
+                len(rows), len(rows[0]) if rows else 0
+            )
+            self._numbers = np.array(
+                [[v if is_number(v) else 0.0 for v in row] for row in rows], dtype=np.float64
+            ).reshape(self._mask.shape)
+        return self._numbers, self._mask
+
+    def number_mask(self):
+        if self._number_mask is not None:
+            return self._number_mask
+        return self.numeric()[1]
+
+    def text_codes(self):
+        if self._codes is None:
+            rows = self.rows
+            pool, ids = [None], {}
+            for row in rows:
+                for v in row:
+                    if isinstance(v, str) and v not in ids:
+                        ids[v] = len(pool)
+                        pool.append(v)
+            self._codes = np.array(
+                [[ids.get(v, 0) if isinstance(v, str) else 0 for v in row] for row in rows], dtype=np.int32
+            ).reshape(len(rows), len(rows[0]) if rows else 0)
+            self._pool = pool
+        return self._codes, self._pool
+
+
+# --- Value coercion ----------------------------------------------------------
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def to_number(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if text == "":
+            return 0
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    raise FormulaError("#VALUE!")
+
+
+def to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, RangeValue):
+        raise FormulaError("#VALUE!")
+    return str(value)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        upper = value.upper()
+        if upper in ("TRUE", "FALSE"):
+            return upper == "TRUE"
+        raise FormulaError("#VALUE!")
+    return bool(to_number(value))
+
+
+def _compare_key(value):
+    # Excel orders numbers < text < booleans; text compares case-insensitively.
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (2, int(value))
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, RangeValue):
+        raise FormulaError("#VALUE!")
+    return (1, str(value).lower())
+
+
+def _compare(op, left, right):
+    if left is None and isinstance(right, str):
+        left = ""
+    if right is None and isinstance(left, str):
+        right = ""
+    a, b = _compare_key(left), _compare_key(right)
+    if op == "=":
+        return a == b
+    if op == "<>":
+        return a != b
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+def _divide(a, b):
+    if b == 0:
+        raise FormulaError("#DIV/0!")
+    return a / b
+
+
+def _power(a, b):
+    try:
+        result = a ** b
+    except (OverflowError, ZeroDivisionError):
+        raise FormulaError("#NUM!")
+    if isinstance(result, complex):
+        raise FormulaError("#NUM!")
+    return result
+
+
+_ARITHMETIC = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _divide,
+    "^": _power,
+}
+
+
+# --- Function registry -------------------------------------------------------
+
+FunctionSpec = namedtuple("FunctionSpec", "func lazy volatile needs_context")
+
+FUNCTIONS = {}
+
+
+def register_function(name, lazy=False, volatile=False, needs_context=False):
+    """Register a worksheet function under ``name`` (case-insensitive).
+
+    ``lazy`` functions receive ``(ctx, *arg_closures)`` and evaluate their
+    arguments themselves (IF, IFERROR ...); a closure for a plain reference
+    argument carries it as its ``ref`` attribute. ``needs_context`` functions receive
+    the evaluation context as first argument. ``volatile`` marks functions whose
+    result changes without any input change (NOW).
+    """
+    def decorator(func):
+        FUNCTIONS[name.upper()] = FunctionSpec(func, lazy, volatile, needs_context)
+        # Functions are bound at compile time, so drop formulas compiled before.
+        compile_formula.cache_clear()
+        return func
+    return decorator
+
+
+def iter_numbers(args):
+    """Yield the numbers of scalar function arguments, coerced the way Excel does."""
+    for arg in args:
+        if not isinstance(arg, RangeValue) and arg is not None:
+            yield to_number(arg)
+
+
+def range_arrays(args):
+    """Yield ``(numbers, mask)`` for the range arguments of a function call."""
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            yield arg.numeric()
+
+
+# --- Tokenizer ---------------------------------------------------------------
+
+_SHEET = r"(?:\[(?P<{0}book>\d+)\])?(?P<{0}sheet>'(?:[^']|'')+'|[\w.]+)!"
+_CELL = r"\$?[A-Za-z]{1,3}\$?\d+"
+
+_TOKEN_RE = re.compile(
+    r"(?P<ws>\s+)"
+    r'|(?P<string>"(?:[^"]|"")*")'
+    r"|(?P<error>#(?:NULL!|DIV/0!|VALUE!|REF!|NAME\?|NUM!|N/A|CYCLE!))"
+    rf"|(?P<ref>(?:{_SHEET.format('r')})?{_CELL}(?::{_CELL})?)(?![\w(])"
+    r"|(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    rf"|(?P<name>(?:{_SHEET.format('n')})?[A-Za-z_\\][\w.]*)"
+    r"|(?P<op><>|<=|>=|[-+*/^&=<>%(),;])"
+)
+
+_CELL_RE = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d+)")
+
+Token = namedtuple("Token", "kind value")
+
+
+def _sheet_of(match, prefix):
+    sheet = match.group(prefix + "sheet")
+    if sheet is None:
+        return None, None
+    if sheet.startswith("'"):
+        sheet = sheet[1:-1].replace("''", "'")
+    book = match.group(prefix + "book")
+    return (int(book) if book is not None else None), sheet
+
+
+def _parse_cell(text):
+    letters, row = _CELL_RE.fullmatch(text).groups()
+    return int(row), column_index(letters)
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise FormulaSyntaxError(f"Unexpected character {text[pos]!r} at position {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == "ws":
+            continue
+        if kind == "ref":
+            book, sheet = _sheet_of(match, "r")
+            cells = match.group("ref").rsplit("!", 1)[-1].split(":")
+            row1, col1 = _parse_cell(cells[0])
+            if len(cells) == 1:
+                tokens.append(Token("ref", CellRef(book, sheet, row1, col1)))
+            else:
+                row2, col2 = _parse_cell(cells[1])
+                tokens.append(Token("ref", RangeRef(
+                    book, sheet, min(row1, row2), min(col1, col2), max(row1, row2), max(col1, col2)
+                )))
+        elif kind == "name":
+            book, sheet = _sheet_of(match, "n")
+            name = match.group("name").rsplit("!", 1)[-1]
+            tokens.append(Token("name", NameRef(book, sheet, name)))
+        elif kind == "string":
+            tokens.append(Token("string", match.group()[1:-1].replace('""', '"')))
+        elif kind == "number":
+            literal = match.group()
+            is_int = literal.isdigit()
+            tokens.append(Token("number", int(literal) if is_int else float(literal)))
+        else:
+            tokens.append(Token(kind, match.group()))
+    return tokens
+
+
+# --- Parser / compiler -------------------------------------------------------
+
+class _Parser:
+    """Recursive-descent parser emitting closures ``fn(ctx) -> value``.
+
+    Precedence, lowest first: comparison, ``&``, ``+ -``, ``* /``, ``^``,
+    unary ``+ -``, postfix ``%`` (unary minus binds tighter than ``^`` as in
+    Excel, so ``-2^2`` is 4).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.refs = []
+        self.volatile = False
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise FormulaSyntaxError("Unexpected end of formula")
+        self.pos += 1
+        return token
+
+    def accept(self, *ops):
+        token = self.peek()
+        if token is not None and token.kind == "op" and token.value in ops:
+            self.pos += 1
+            return token.value
+        return None
+
+    def expect(self, op):
+        if not self.accept(op):
+            token = self.peek()
+            found = token.value if token else "end of formula"
+            raise FormulaSyntaxError(f"Expected {op!r}, found {found!r}")
+
+    def parse(self):
+        fn = self.comparison()
+        if self.peek() is not None:
+            raise FormulaSyntaxError(f"Unexpected {self.peek().value!r}")
+        return fn
+
+    def comparison(self):
+        left = self.concat()
+        while True:
+            op = self.accept("=", "<>", "<", ">", "<=", ">=")
+            if not op:
+                return left
+            right = self.concat()
+            left = (lambda op, a, b: lambda ctx: _compare(op, a(ctx), b(ctx)))(op, left, right)
+
+    def concat(self):
+        left = self.additive()
+        while self.accept("&"):
+            right = self.additive()
+            left = (lambda a, b: lambda ctx: to_text(a(ctx)) + to_text(b(ctx)))(left, right)
+        return left
+
+    def _binary(self, operand, ops):
+        left = operand()
+        while True:
+            op = self.accept(*ops)
+            if not op:
+                return left
+            right = operand()
+            func = _ARITHMETIC[op]
+            left = (lambda f, a, b: lambda ctx: f(to_number(a(ctx)), to_number(b(ctx))))(func, left, right)
+
+    def additive(self):
+        return self._binary(self.term, ("+", "-"))
+
+    def term(self):
+        return self._binary(self.power, ("*", "/"))
+
+    def power(self):
+        return self._binary(self.unary, ("^",))
+
+    def unary(self):
+        op = self.accept("+", "-")
+        if op == "-":
+            operand = self.unary()
+            return lambda ctx: -to_number(operand(ctx))
+        if op == "+":
+            return self.unary()
+        return self.postfix()
+
+    def postfix(self):
+        fn = self.primary()
+        while self.accept("%"):
+            fn = (lambda a: lambda ctx: to_number(a(ctx)) / 100)(fn)
+        return fn
+
+    def primary(self):
+        token = self.next()
+        kind, value = token.kind, token.value
+        if kind in ("number", "string"):
+            return lambda ctx: value
+        if kind == "error":
+            def raise_error(ctx):
+                raise FormulaError(value)
+            return raise_error
+        if kind == "ref":
+            self.refs.append(value)
+            if isinstance(value, CellRef):
+                fn = lambda ctx: ctx.cell(value)
+            else:
+                fn = lambda ctx: ctx.range(value)
+            fn.ref = value  # lets lazy functions take a reference argument as such
+            return fn
+        if kind == "name":
+            if self.accept("("):
+                return self.call(value.name)
+            upper = value.name.upper()
+            if value.sheet is None and upper in ("TRUE", "FALSE"):
+                flag = upper == "TRUE"
+                return lambda ctx: flag
+            self.refs.append(value)
+            return lambda ctx: ctx.name(value)
+        if kind == "op" and value == "(":
+            fn = self.comparison()
+            self.expect(")")
+            return fn
+        raise FormulaSyntaxError(f"Unexpected {value!r}")
+
+    def call(self, name):
+        args = []
+        if not self.accept(")"):
+            while True:
+                token = self.peek()
+                if token is not None and token.kind == "op" and token.value in (",", ";", ")"):
+                    args.append(lambda ctx: None)  # omitted argument, e.g. IF(x,,1)
+                else:
+                    args.append(self.comparison())
+                if self.accept(")"):
+                    break
+                if not self.accept(",", ";"):
+                    raise FormulaSyntaxError(f"Expected ',' or ')' in {name}()")
+        spec = FUNCTIONS.get(name.upper())
+        if spec is None:
+            def unknown(ctx):
+                raise FormulaError("#NAME?", f"Unknown function {name}")
+            return unknown
+        if spec.volatile:
+            self.volatile = True
+        func = spec.func
+        if spec.lazy:
+            return lambda ctx: func(ctx, *args)
+        if spec.needs_context:
+            return lambda ctx: func(ctx, *[arg(ctx) for arg in args])
+        return lambda ctx: func(*[arg(ctx) for arg in args])
+
+
+class CompiledFormula:
+    """A parsed formula: ``evaluate(ctx)`` plus the references it reads."""
+
+    __slots__ = ("text", "fn", "refs", "volatile")
+
+    def __init__(self, text, fn, refs, volatile):
+        self.text = text
+        self.fn = fn
+        self.refs = refs
+        self.volatile = volatile
+
+    def evaluate(self, ctx):
+        value = self.fn(ctx)
+        if value is None:
+            return 0  # a formula pointing at an empty cell shows 0, as in Excel
+        if isinstance(value, RangeValue):
+            raise FormulaError("#VALUE!")
+        return value
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_formula(text):
+    """Compile formula text (with or without the leading ``=``), cached by text.
+
+    Raises FormulaSyntaxError when the text cannot be parsed.
+    """
+    body = text[1:] if text.startswith("=") else text
+    parser = _Parser(tokenize(body))
+    fn = parser.parse()
+    return CompiledFormula(text, fn, tuple(parser.refs), parser.volatile)
+
+
+# --- Built-in functions ------------------------------------------------------
+
+@register_function("SUM")
+def _sum(*args):
+    # Non-numeric cells are stored as 0, so ranges sum without the mask.
+    return sum(iter_numbers(args)) + sum(float(numbers.sum()) for numbers, _ in range_arrays(args))
+
+
+@register_function("AVERAGE")
+def _average(*args):
+    scalars = list(iter_numbers(args))
+    total, count = sum(scalars), len(scalars)
+    for numbers, mask in range_arrays(args):
+        total += float(numbers.sum())
+        count += int(np.count_nonzero(mask))
+    if not count:
+        raise FormulaError("#DIV/0!")
+    return total / count
+
+
+def _extreme(args, scalar_pick, array_pick):
+    candidates = list(iter_numbers(args))
+    for numbers, mask in range_arrays(args):
+        if mask.any():
+            candidates.append(float(array_pick(numbers[mask])))
+    return scalar_pick(candidates, default=0)
+
+
+@register_function("MIN")
+def _min(*args):
+    return _extreme(args, min, np.min)
+
+
+@register_function("MAX")
+def _max(*args):
+    return _extreme(args, max, np.max)
+
+
+@register_function("COUNT")
+def _count(*args):
+    # Excel's COUNT skips error cells of a range instead of returning the error.
+    count = sum(1 for arg in args if is_number(arg))
+    return count + sum(
+        int(np.count_nonzero(arg.number_mask())) for arg in args if isinstance(arg, RangeValue)
+    )
+
+
+@register_function("SUMPRODUCT")
+def _sumproduct(*args):
+    arrays = []
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            arrays.append(arg.numeric()[0])
+        else:
+            arrays.append(np.array([[to_number(arg)]], dtype=np.float64))
+    if not arrays or any(a.shape != arrays[0].shape for a in arrays):
+        raise FormulaError("#VALUE!")
+    product = arrays[0]
+    for array in arrays[1:]:
+        product = product * array
+    return float(product.sum())
+
+
+@register_function("COUNTA")
+def _counta(*args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            count += sum(1 for value in arg.values() if value not in (None, ""))
+        elif arg is not None:
+            count += 1
+    return count
+
+
+@register_function("ABS")
+def _abs(value):
+    return abs(to_number(value))
+
+
+@register_function("ROUND")
+def _round(value, digits=0):
+    value, digits = to_number(value), int(to_number(digits))
+    factor = 10 ** digits
+    # Excel rounds half away from zero.
+    return math.copysign(math.floor(abs(value) * factor + 0.5), value) / factor
+
+
+@register_function("LEN")
+def _len(value):
+    return len(to_text(value))
+
+
+@register_function("CONCATENATE")
+def _concatenate(*args):
+    return "".join(to_text(arg) for arg in args)
+
+
+@register_function("AND")
+def _and(*args):
+    values = [v for arg in args for v in (arg.values() if isinstance(arg, RangeValue) else [arg])]
+    return all(to_bool(v) for v in values if v is not None)
+
+
+@register_function("OR")
+def _or(*args):
+    values = [v for arg in args for v in (arg.values() if isinstance(arg, RangeValue) else [arg])]
+    return any(to_bool(v) for v in values if v is not None)
+
+
+@register_function("NOT")
+def _not(value):
+    return not to_bool(value)
+
+
+@register_function("IF", lazy=True)
+def _if(ctx, condition, if_true=None, if_false=None):
+    if to_bool(condition(ctx)):
+        return if_true(ctx) if if_true is not None else True
+    return if_false(ctx) if if_false is not None else False
+
+
+@register_function("IFERROR", lazy=True)
+def _iferror(ctx, value, fallback):
+    try:
+        return value(ctx)
+    except FormulaError:
+        return fallback(ctx)
+
+
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+@register_function("NOW", volatile=True)
+def _now():
+    # Excel date serial: days since 1899-12-30, time as the fraction.
+    delta = datetime.datetime.now() - _EXCEL_EPOCH
+    return delta.days + delta.seconds / 86400
@@ -1,6 +1,8 @@
 import sqlite3
 from pathlib import Path
 
+from logic.migrations import migrate
+
 BASE = Path(__file__).parent
 SCHEMA_FILE = BASE / "init_odriv.sql"
 DB_FILE = BASE / "odriv.db"
@@ -10,5 +12,6 @@ with open(SCHEMA_FILE, "r") as f:
 
 with sqlite3.connect(DB_FILE) as conn:
     conn.executescript(schema)
+    version = migrate(conn)
 
-print(f"Database created as {DB_FILE}")
\ No newline at end of file
+print(f"Database created as {DB_FILE} (schema version {version})")
\ No newline at end of file
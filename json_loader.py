@@ -1,63 +1,43 @@
 import os
-import json
-from dash import dcc, html, dash_table
+import weakref
+from dash import Input, Output, State, MATCH
+from logic.sheet_cache import load_sheet
+from logic.sheet_query import query_sheet_window
 
-def load_json_sheets(json_dir):
-    tabs = []
-    files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    for fname in sorted(files):
-        fpath = os.path.join(json_dir, fname)
-        with open(fpath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        cells = data.get("cells", {})
-        # Parse cells into rows/columns for DataTable
-        rows = []
-        cell_map = {}
-        for cell, cell_data in cells.items():
-            col, row = None, None
-            for i, c in enumerate(cell):
-                if c.isdigit():
-                    col = cell[:i]
-                    row = cell[i:]
-                    break
-            if col and row:
-                if row not in cell_map:
-                    cell_map[row] = {}
-                cell_map[row][col] = cell_data.get("value")
-        all_cols = set()
-        for row in cell_map.values():
-            all_cols.update(row.keys())
-        all_cols = sorted(all_cols)
-        for row_num in sorted(cell_map.keys(), key=lambda x: int(x)):
-            row_data = {"Row": row_num}
-            for col in all_cols:
-                row_data[col] = cell_map[row_num].get(col)
-            rows.append(row_data)
-        columns = [{"name": "Row", "id": "Row"}] + [{"name": col, "id": col} for col in all_cols]
-        table = dash_table.DataTable(
-            data=rows,
-            columns=columns,
-            page_size=20,
-            style_table={"overflowX": "auto"},
-            style_cell={"textAlign": "left", "maxWidth": "350px"},
-            style_header={"fontWeight": "bold", "backgroundColor": "#e9ecef"},
-        )
-        tab_label = fname.replace(".json", "")
-        tabs.append(
-            dcc.Tab(
-                label=tab_label,
-                value=tab_label,
-                children=[
-                    html.H5(f"JSON Sheet: {tab_label}"),
-                    table
-                ]
-            )
-        )
-    if tabs:
-        return dcc.Tabs(
-            id="json-sheet-tabs",
-            value=tabs[0].value,
-            children=tabs,
+PAGE_SIZE = 20
+
+# app -> sheet folders whose tables it pages (one callback per folder)
+_registered = weakref.WeakKeyDictionary()
+
+def sheet_table_id(json_dir, sheet_name):
+    """Component id of a sheet table paged by ``register_paging_callbacks(app, json_dir)``."""
+    return {"type": "json-sheet-table", "dir": json_dir, "index": sheet_name}
+
+def register_paging_callbacks(app, json_dir):
+    """Serve the pages of the ``sheet_table_id(json_dir, ...)`` tables (once per app and folder).
+
+    The folder is part of the id pattern, so each folder gets its own
+    callback and the browser never chooses which folder is read.
+    """
+    folders = _registered.setdefault(app, set())
+    if json_dir in folders:
+        return
+    folders.add(json_dir)
+    table = {"type": "json-sheet-table", "dir": json_dir, "index": MATCH}
+
+    @app.callback(
+        Output(table, "data"),
+        Output(table, "page_count"),
+        Input(table, "page_current"),
+        Input(table, "page_size"),
+        Input(table, "filter_query"),
+        Input(table, "sort_by"),
+        State(table, "id"),
+        prevent_initial_call=True,
+    )
+    def page_json_sheet(page_current, page_size, filter_query, sort_by, table_id):
+        sheet = load_sheet(os.path.join(json_dir, f"{table_id['index']}.json"))
+        _, rows, page_count = query_sheet_window(
+            sheet, page_current, page_size or PAGE_SIZE, filter_query, sort_by
         )
-    else:
-        return html.Div("No JSON sheets found.")
\ No newline at end of file
+        return rows, page_count
@@ -0,0 +1,69 @@
+import sqlite3
+
+# Schema migrations, applied in order. The number of applied migrations is kept
+# in PRAGMA user_version, so an existing odriv.db is upgraded in place and each
+# migration runs exactly once. Append new migrations; never edit shipped ones.
+MIGRATIONS = [
+    # 1: ratings history lookups by project
+    """
+    CREATE INDEX IF NOT EXISTS idx_project_ratings_project_id
+        ON project_ratings (project_id, id);
+    CREATE INDEX IF NOT EXISTS idx_project_ratings_project_created
+        ON project_ratings (project_id, created_at);
+    """,
+    # 2: latest rating per project, kept up to date by a trigger
+    """
+    CREATE TABLE IF NOT EXISTS project_latest_rating (
+        project_id INTEGER PRIMARY KEY,
+        rating_id INTEGER NOT NULL
+    );
+    INSERT OR REPLACE INTO project_latest_rating (project_id, rating_id)
+        SELECT project_id, MAX(id) FROM project_ratings
+        WHERE project_id IS NOT NULL GROUP BY project_id;
+    CREATE TRIGGER IF NOT EXISTS trg_project_ratings_latest
+    AFTER INSERT ON project_ratings
+    WHEN NEW.project_id IS NOT NULL
+    BEGIN
+        INSERT INTO project_latest_rating (project_id, rating_id)
+            VALUES (NEW.project_id, NEW.id)
+            ON CONFLICT(project_id) DO UPDATE SET rating_id = excluded.rating_id
+            WHERE excluded.rating_id > project_latest_rating.rating_id;
+    END;
+    """,
+    # 3: config revision counter, bumped by every change to the config table
+    """
+    CREATE TABLE IF NOT EXISTS config_revision (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        revision INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO config_revision (id, revision) VALUES (1, 0);
+    CREATE TRIGGER IF NOT EXISTS trg_config_insert AFTER INSERT ON config
+    BEGIN UPDATE config_revision SET revision = revision + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_config_update AFTER UPDATE ON config
+    BEGIN UPDATE config_revision SET revision = revision + 1 WHERE id = 1; END;
+    CREATE TRIGGER IF NOT EXISTS trg_config_delete AFTER DELETE ON config
+    BEGIN UPDATE config_revision SET revision = revision + 1 WHERE id = 1; END;
+    """,
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply the pending migrations, each in its own transaction; return the new version."""
+    version = schema_version(conn)
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        print(f"Applied migration {number}")
+    return schema_version(conn)
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+    db_file = sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / "odriv.db"
+    with sqlite3.connect(db_file) as conn:
+        print(f"{db_file} is at schema version {migrate(conn)}")
@@ -1,43 +1,86 @@
+import hashlib
+import multiprocessing
 import pandas as pd
 import sqlite3
+import threading
 from pathlib import Path
-from dash import Dash, dcc, html, dash_table
+from dash import Dash, dcc, html, dash_table, Input, Output, State, MATCH
 import dash_bootstrap_components as dbc
+from logic.db import get_conn
+from logic.sheet_query import query_table_page, quote_identifier
+from logic.xlsm_import import import_workbook
 
 EXCEL_PATH = "ODRIV_v28_0_6.xlsm"
 DB_PATH = "odriv.db"
+PAGE_SIZE = 20
 
-def bootstrap_db_from_excel(excel_path, db_path):
+# Content hash of each imported sheet (and of the whole workbook file)
+SHEET_HASHES = "_odriv_sheet_hashes"
+WORKBOOK_HASH_KEY = "__workbook__"
+
+# Per-table change counters, bumped by triggers installed on every sheet table
+TABLE_VERSIONS = "_odriv_table_versions"
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def bootstrap_db_from_excel(excel_path, db_path, json_dir=None, workers=None):
     """
     Loads all sheets from Excel file and saves each sheet as a table in SQLite DB.
     SKIPS sheets that are empty or have no column headers (to avoid SQL syntax errors).
+    The workbook is not even opened when its content hash is the one imported
+    last time. Otherwise the sheets are read in parallel (see xlsm_import) and
+    only those whose content hash changed are rewritten, all in one transaction.
+    With ``json_dir`` the per-sheet JSON exports are regenerated as well.
     """
-    xls = pd.ExcelFile(excel_path, engine="openpyxl")
-    conn = sqlite3.connect(db_path)
-    for sheet_name in xls.sheet_names:
-        df = pd.read_excel(xls, sheet_name=sheet_name)
-        # Skip empty sheets or sheets with no columns
-        if df.empty or df.shape[1] == 0:
-            print(f"Skipping empty or invalid sheet: {sheet_name}")
-            continue
-        # Replace table if already exists
-        df.to_sql(sheet_name, conn, if_exists="replace", index=False)
-    conn.close()
-    print(f"Bootstrapped database from {excel_path}")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {SHEET_HASHES} "
+            "(sheet TEXT PRIMARY KEY, sha1 TEXT, row_count INTEGER, imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        stored = dict(conn.execute(f"SELECT sheet, sha1 FROM {SHEET_HASHES}").fetchall())
+        file_sha1 = _file_sha1(excel_path)
+        if stored.get(WORKBOOK_HASH_KEY) == file_sha1 and not json_dir:
+            print(f"{excel_path} unchanged since the last import")
+            return
 
-def load_sheets_from_db(db_path):
-    """
-    Loads all tables from SQLite DB as {sheet_name: dataframe}
-    """
-    conn = sqlite3.connect(db_path)
-    # Get all table names
-    tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table';", conn)
-    sheets = {}
-    for sheet_name in tables["name"]:
-        df = pd.read_sql(f"SELECT * FROM '{sheet_name}'", conn)
-        sheets[sheet_name] = df
-    conn.close()
-    return sheets
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("BEGIN")
+        try:
+            imported = import_workbook(excel_path, conn, json_dir, workers, skip=stored)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {SHEET_HASHES} (sheet, sha1, row_count) VALUES (?, ?, ?)",
+                [(sheet_name, sha1, row_count) for sheet_name, row_count, sha1, _ in imported]
+                + [(WORKBOOK_HASH_KEY, file_sha1, None)]
+            )
+            # Re-created tables lost their triggers; the sheet tab cache relies on them.
+            install_change_counters(conn, [sheet_name for sheet_name, *_ in imported])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    for sheet_name, row_count, _, seconds in imported:
+        print(f"Imported sheet {sheet_name} ({row_count} rows, read in {seconds:.2f}s)")
+    print(f"Bootstrapped database from {excel_path}: {len(imported)} sheets changed")
+
+def start_background_bootstrap(excel_path, db_path):
+    """Run the Excel import in a background thread so it does not hold up startup."""
+    def run():
+        try:
+            bootstrap_db_from_excel(excel_path, db_path)
+            print(f"You can now delete {excel_path}: All data is stored in {db_path}.")
+        except Exception as e:
+            print(f"Excel bootstrap failed: {e}")
+    thread = threading.Thread(target=run, name="odriv-excel-bootstrap", daemon=True)
+    thread.start()
+    return thread
 
 def make_project_settings():
     return dbc.Card(
@@ -89,44 +132,177 @@ def make_project_settings():
         style={"display": "block"},
     )
 
-def make_sheet_tabs(sheets):
-    tabs = []
-    for sheet, df in sheets.items():
-        if df.empty:
-            table = html.Div("No data in this sheet.")
-        else:
-            table = dash_table.DataTable(
-                data=df.to_dict("records"),
-                columns=[{"name": col, "id": col} for col in df.columns],
-                page_size=20,
-                style_table={"overflowX": "auto"},
-                style_cell={"textAlign": "left", "maxWidth": "350px"},
-                style_header={"fontWeight": "bold", "backgroundColor": "#e9ecef"},
-            )
-        tabs.append(
-            dcc.Tab(
-                label=sheet,
-                value=sheet,
-                children=[
-                    html.H5(f"Sheet: {sheet}"),
-                    table
-                ]
-            )
+def make_sheet_tab(sheet, df, row_count=None):
+    """One sheet tab; ``df`` only needs the first page when ``row_count`` is given."""
+    if row_count is None:
+        row_count = len(df)
+    if df.empty:
+        table = html.Div("No data in this sheet.")
+    else:
+        # Only the first page is embedded; page_sheet_table queries the rest from SQLite.
+        table = dash_table.DataTable(
+            id={"type": "odriv-sheet-table", "index": sheet},
+            data=df.head(PAGE_SIZE).to_dict("records"),
+            columns=[{"name": col, "id": col} for col in df.columns],
+            page_action="custom",
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_count=max(1, -(-row_count // PAGE_SIZE)),
+            filter_action="custom",
+            filter_query="",
+            filter_options={"case": "insensitive"},
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
+            style_table={"overflowX": "auto"},
+            style_cell={"textAlign": "left", "maxWidth": "350px"},
+            style_header={"fontWeight": "bold", "backgroundColor": "#e9ecef"},
         )
+    return dcc.Tab(
+        label=sheet,
+        value=sheet,
+        children=[
+            html.H5(f"Sheet: {sheet}"),
+            table
+        ]
+    )
+
+def _tabs_container(tabs):
     return dcc.Tabs(
         id="odriv-sheet-tabs",
-        value=list(sheets.keys())[0] if sheets else None,
+        value=tabs[0].value if tabs else None,
         children=tabs,
     )
 
+# --- Process-level sheet tab cache ---
+# A page load first compares PRAGMA data_version (which moves whenever another
+# connection commits) with the value seen last time: unchanged means the
+# cached tabs are served as they are. Otherwise each table's signature (its
+# schema entry and its change counter) tells which tables changed, and only
+# those are re-read (first page and row count). Change counters exist on the
+# imported sheet tables only; the other (operational) tables are small and are
+# re-read whenever data_version moves. The counters are installed at startup
+# and by the bootstrap, so page loads only ever read the database.
+
+TAB_READ_TIMEOUT = 1.0  # seconds a page load waits for a busy database
+
+_tab_cache_lock = threading.Lock()
+_tab_caches = {}  # db_path -> {"conn", "data_version", "tables", "tabs"}
+
+def _install_change_counter(conn, table):
+    quoted = quote_identifier(table)
+    conn.execute(f"INSERT OR IGNORE INTO {TABLE_VERSIONS} (name, version) VALUES (?, 0)", (table,))
+    literal = "'" + table.replace("'", "''") + "'"
+    bump = f"BEGIN UPDATE {TABLE_VERSIONS} SET version = version + 1 WHERE name = {literal}; END"
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        trigger = quote_identifier(f"_odriv_v_{table}_{event.lower()}")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {quoted} {bump}")
+
+def _table_names(conn):
+    return {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+def install_change_counters(conn, tables=None):
+    """Add the change counters of the sheet tables (all imported ones by default); the caller commits."""
+    if tables is None:
+        if SHEET_HASHES not in _table_names(conn):
+            return
+        tables = [
+            name for name, in conn.execute(
+                f"SELECT sheet FROM {SHEET_HASHES} WHERE sheet IN "
+                "(SELECT name FROM sqlite_master WHERE type='table')"
+            )
+        ]
+    if not tables:
+        return
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS} (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    for table in tables:
+        _install_change_counter(conn, table)
+
+def prepare_sheet_db(db_path):
+    """Switch the database to WAL (readers never wait for the bootstrap) and add missing counters."""
+    if not Path(db_path).exists():
+        return
+    try:
+        conn = sqlite3.connect(db_path, timeout=TAB_READ_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("BEGIN")
+            install_change_counters(conn)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Sheet cache: change counters not installed ({e})")
+
+def _table_signatures(conn):
+    """``{table: signature}``; the signature is None for tables without a change counter."""
+    tables = conn.execute(
+        "SELECT name, rootpage, sql FROM sqlite_master WHERE type='table' "
+        "AND name NOT LIKE 'sqlite_%' AND name NOT IN (?, ?) ORDER BY rowid",
+        (TABLE_VERSIONS, SHEET_HASHES)
+    ).fetchall()
+    versions = {}
+    if TABLE_VERSIONS in _table_names(conn):
+        versions = dict(conn.execute(f"SELECT name, version FROM {TABLE_VERSIONS}").fetchall())
+    triggers = {
+        row[0] for row in conn.execute("SELECT tbl_name FROM sqlite_master WHERE type='trigger' AND name LIKE '_odriv_v_%'")
+    }
+    return {
+        name: (rootpage, sql, versions.get(name)) if name in triggers else None
+        for name, rootpage, sql in tables
+    }
+
+def _read_tabs(cache):
+    conn = cache["conn"]
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if cache["tabs"] is not None and data_version == cache["data_version"]:
+        return cache["tabs"]
+    tables = {}
+    for name, signature in _table_signatures(conn).items():
+        cached = cache["tables"].get(name)
+        if cached is not None and signature is not None and cached[0] == signature:
+            tables[name] = cached
+            continue
+        quoted = quote_identifier(name)
+        df = pd.read_sql(f"SELECT * FROM {quoted} LIMIT {PAGE_SIZE}", conn)
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+        tables[name] = (signature, make_sheet_tab(name, df, row_count))
+        print(f"Sheet cache: loaded {name}")
+    cache["tables"] = tables
+    cache["tabs"] = _tabs_container([tab for _, tab in tables.values()])
+    cache["data_version"] = data_version
+    return cache["tabs"]
+
+def load_sheet_tabs(db_path):
+    """Sheet tabs for the layout, rebuilt only for the tables that changed (read-only)."""
+    with _tab_cache_lock:
+        cache = _tab_caches.get(db_path)
+        if cache is None:
+            if not Path(db_path).exists():
+                return _tabs_container([])
+            uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+            cache = _tab_caches[db_path] = {
+                "conn": sqlite3.connect(uri, uri=True, timeout=TAB_READ_TIMEOUT, check_same_thread=False),
+                "data_version": None,
+                "tables": {},
+                "tabs": None,
+            }
+        try:
+            return _read_tabs(cache)
+        except sqlite3.OperationalError as e:
+            if cache["tabs"] is None:
+                raise
+            # Busy (e.g. a rollback-journal database being written): serve the previous tabs.
+            print(f"Sheet cache: database busy ({e}), serving the cached tabs")
+            return cache["tabs"]
+
 def serve_layout():
-    sheets = load_sheets_from_db(DB_PATH)
     return dbc.Container(
         [
             html.H2("ODRIV Dashboard"),
             dbc.Row([
                 dbc.Col(make_project_settings(), width=3),
-                dbc.Col(make_sheet_tabs(sheets), width=9),
+                dbc.Col(load_sheet_tabs(DB_PATH), width=9),
             ], align="start"),
         ],
         fluid=True,
@@ -134,9 +310,12 @@ def serve_layout():
     )
 
 # --- Bootstrap: Load Excel data to DB only if Excel exists ---
-if Path(EXCEL_PATH).exists():
-    bootstrap_db_from_excel(EXCEL_PATH, DB_PATH)
-    print(f"You can now delete {EXCEL_PATH}: All data is stored in {DB_PATH}.")
+# Not in the import's worker processes, which re-import this module when spawned.
+# The change counters of the sheet tab cache are set up here, before any page load.
+if multiprocessing.parent_process() is None:
+    prepare_sheet_db(DB_PATH)
+    if Path(EXCEL_PATH).exists():
+        start_background_bootstrap(EXCEL_PATH, DB_PATH)
 
 # --- Create Dash app ---
 app = Dash(
@@ -146,5 +325,21 @@ app = Dash(
 
 app.layout = serve_layout
 
+@app.callback(
+    Output({"type": "odriv-sheet-table", "index": MATCH}, "data"),
+    Output({"type": "odriv-sheet-table", "index": MATCH}, "page_count"),
+    Input({"type": "odriv-sheet-table", "index": MATCH}, "page_current"),
+    Input({"type": "odriv-sheet-table", "index": MATCH}, "page_size"),
+    Input({"type": "odriv-sheet-table", "index": MATCH}, "filter_query"),
+    Input({"type": "odriv-sheet-table", "index": MATCH}, "sort_by"),
+    State({"type": "odriv-sheet-table", "index": MATCH}, "id"),
+    prevent_initial_call=True,
+)
+def page_sheet_table(page_current, page_size, filter_query, sort_by, table_id):
+    """Filter, sort and page one sheet table inside SQLite (on the thread's tuned connection)."""
+    return query_table_page(
+        get_conn(DB_PATH), table_id["index"], page_current, page_size or PAGE_SIZE, filter_query, sort_by
+    )
+
 if __name__ == "__main__":
     app.run_server(debug=True)
\ No newline at end of file
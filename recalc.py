@@ -0,0 +1,146 @@
+"""
+Cell dependency graph
+=====================
+
+Tracks which cells each formula reads (its precedents) and, in reverse, which
+formulas read each cell (its dependents). After an edit only the cells
+downstream of the changed ones are marked dirty, and they are recalculated in
+topological order so every formula is evaluated exactly once, after all of its
+inputs. Cells that take part in a reference cycle are reported separately so
+the caller can mark them ``#CYCLE!`` instead of recursing forever.
+
+Nodes are any hashable keys (``"A1"`` in the spreadsheet app, ``(sheet, row,
+col)`` tuples for a whole workbook).
+"""
+
+from collections import deque
+
+CYCLE_ERROR = "#CYCLE!"
+
+
+class DependencyGraph:
+    """Precedent/dependent edges between cells."""
+
+    def __init__(self):
+        self.precedents = {}
+        self.dependents = {}
+
+    def set_precedents(self, node, precedents):
+        """Replace the set of cells ``node`` reads."""
+        self.discard(node)
+        precedents = frozenset(precedents)
+        self.precedents[node] = precedents
+        for precedent in precedents:
+            self.dependents.setdefault(precedent, set()).add(node)
+
+    def discard(self, node):
+        """Forget the precedents of ``node`` (e.g. when it stops being a formula)."""
+        for precedent in self.precedents.pop(node, ()):
+            dependents = self.dependents.get(precedent)
+            if dependents is not None:
+                dependents.discard(node)
+                if not dependents:
+                    del self.dependents[precedent]
+
+    def downstream(self, nodes):
+        """Return ``nodes`` plus every cell that transitively depends on them."""
+        seen = set(nodes)
+        queue = deque(seen)
+        while queue:
+            for dependent in self.dependents.get(queue.popleft(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    queue.append(dependent)
+        return seen
+
+    def recalc_order(self, nodes):
+        """Order ``nodes`` so each comes after its precedents within the set.
+
+        Returns ``(order, cyclic)``: ``cyclic`` holds the nodes that are part of
+        a reference cycle (they are left out of ``order``); nodes that merely
+        depend on a cycle are still ordered after it.
+        """
+        nodes = set(nodes)
+        pending = {
+            node: sum(1 for p in self.precedents.get(node, ()) if p in nodes and p != node)
+            for node in nodes
+        }
+        cyclic = {node for node in nodes if node in self.precedents.get(node, ())}
+        order = []
+        while True:
+            ready = deque(node for node, count in pending.items() if count == 0 and node not in cyclic)
+            while ready:
+                node = ready.popleft()
+                del pending[node]
+                order.append(node)
+                for dependent in self.dependents.get(node, ()):
+                    if dependent in pending:
+                        pending[dependent] -= 1
+                        if pending[dependent] == 0 and dependent not in cyclic:
+                            ready.append(dependent)
+            if not pending:
+                return order, cyclic
+            # Stalled: whatever is left sits on or behind a cycle. Mark the
+            # strongly connected components with a cycle, release their
+            # dependents and carry on.
+            stuck = set(pending)
+            found = set()
+            for component in self._cycles(stuck):
+                found.update(component)
+            if not found:
+                cyclic.update(stuck)
+                return order, cyclic
+            cyclic.update(found)
+            for node in stuck & cyclic:
+                del pending[node]
+                for dependent in self.dependents.get(node, ()):
+                    if dependent in pending:
+                        pending[dependent] -= 1
+
+    def _cycles(self, nodes):
+        """Yield the strongly connected components of ``nodes`` that contain a cycle."""
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+        for root in nodes:
+            if root in index:
+                continue
+            work = [(root, iter(self.dependents.get(root, ())))]
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                advanced = False
+                for child in children:
+                    if child not in nodes:
+                        continue
+                    if child not in index:
+                        index[child] = low[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.dependents.get(child, ()))))
+                        advanced = True
+                        break
+                    if child in on_stack:
+                        low[node] = min(low[node], index[child])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in self.precedents.get(node, ()):
+                        yield component
@@ -0,0 +1,172 @@
+"""
+Offline workbook recalculation
+==============================
+
+Re-evaluates every formula of the JSON sheet exports of a folder and writes
+the results back into the ``value`` of the formula cells, keeping the
+``{"cells": {...}}`` format of the exports.
+
+Sheets are split into independent groups: two sheets share a group when a
+formula of one reads the other. Each group is recalculated in its own worker
+process, so a nightly run over many sheets scales with the number of cores.
+Per-sheet evaluation and write times are reported at the end.
+
+Usage::
+
+    python -m logic.recalc_workbook <json_dir> [output_dir] [workers]
+
+Without ``output_dir`` the exports are updated in place. Otherwise
+``output_dir`` receives a complete copy of the folder: the recalculated
+sheets are rewritten there and the other exports are copied unchanged.
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logic.cell_store import parse_reference
+from logic.formulas import CellRef, RangeRef, FormulaSyntaxError, compile_formula
+from logic.a1 import column_letter
+from logic.sheet_cache import load_sheet, sheet_files
+from logic.workbook import Workbook
+
+
+def _sheet_path(json_dir, name):
+    return os.path.join(json_dir, name + ".json")
+
+
+def sheet_groups(book, names=None):
+    """Partition the sheets of ``book`` into groups with no references between them.
+
+    Only groups containing formulas are returned, largest first.
+    """
+    parent = {name: name for name in book.sheet_names}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for (sheet, _, _), text in book.formulas.items():
+        try:
+            refs = compile_formula(text).refs
+        except FormulaSyntaxError:
+            continue
+        for ref in refs:
+            target = ref.sheet
+            if not isinstance(ref, (CellRef, RangeRef)):
+                # Defined names: follow them when they point at another sheet.
+                target = None
+                reference = (names or {}).get(ref.name.upper())
+                if isinstance(reference, str):
+                    try:
+                        target = parse_reference(reference, default_sheet=sheet)[0]
+                    except ValueError:
+                        pass
+            if target in parent and target != sheet:
+                parent[find(target)] = find(sheet)
+
+    groups = {}
+    for name in book.sheet_names:
+        groups.setdefault(find(name), []).append(name)
+    with_formulas = {sheet for sheet, _, _ in book.formulas}
+    result = [group for group in groups.values() if with_formulas.intersection(group)]
+    counts = {name: 0 for name in book.sheet_names}
+    for sheet, _, _ in book.formulas:
+        counts[sheet] += 1
+    result.sort(key=lambda group: -sum(counts[name] for name in group))
+    return result
+
+
+def write_sheet_results(source, target, results):
+    """Copy a sheet export to ``target`` with ``results`` ({address: value}) as cell values."""
+    with open(source, "rb") as f:
+        newline = "\r\n" if b"\r\n" in f.read(4096) else "\n"
+    with open(source, encoding="utf-8") as f:
+        data = json.load(f)
+    cells = data.get("cells", {})
+    for address, value in results.items():
+        cells.setdefault(address, {"value": None, "formula": None, "namedRange": None})["value"] = value
+    tmp_path = target + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline=newline) as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, target)
+
+
+def copy_unchanged_sheets(json_dir, output_dir, written):
+    """Copy the sheet exports of ``json_dir`` not in ``written`` to ``output_dir`` as they are."""
+    for fname in sheet_files(json_dir):
+        if fname[:-len(".json")] not in written:
+            shutil.copy2(os.path.join(json_dir, fname), os.path.join(output_dir, fname))
+
+
+def recalc_group(json_dir, output_dir, sheet_names, names=None):
+    """Recalculate one group of sheets and write them out (runs in a worker process).
+
+    Returns ``[(sheet, formula_count, eval_seconds, write_seconds)]``.
+    """
+    book = Workbook(
+        [(name, load_sheet(_sheet_path(json_dir, name))) for name in sheet_names], names=names
+    )
+    timings = {}
+    book.recalculate(timings=timings)
+
+    by_sheet = {}
+    for (sheet, row, col), result in book.results.items():
+        if (sheet, row, col) in book.formulas:
+            by_sheet.setdefault(sheet, {})[f"{column_letter(col)}{row}"] = result
+    report = []
+    for sheet in sheet_names:
+        results = by_sheet.get(sheet)
+        if not results:
+            continue
+        start = time.perf_counter()
+        write_sheet_results(
+            _sheet_path(json_dir, sheet), _sheet_path(output_dir, sheet), results
+        )
+        report.append((sheet, len(results), timings.get(sheet, 0.0), time.perf_counter() - start))
+    return report
+
+
+def recalc_workbook(json_dir, output_dir=None, workers=None, names=None):
+    """Recalculate all sheets of ``json_dir`` in parallel; return the per-sheet report.
+
+    With a separate ``output_dir``, the sheets without formula results are
+    copied there too, so it holds the whole workbook.
+    """
+    output_dir = output_dir or json_dir
+    os.makedirs(output_dir, exist_ok=True)
+    names = {key.upper(): value for key, value in (names or {}).items()}
+    groups = sheet_groups(Workbook.load(json_dir, names=names), names)
+    report = []
+    workers = min(workers or os.cpu_count() or 1, max(len(groups), 1))
+    if workers == 1:
+        for group in groups:
+            report.extend(recalc_group(json_dir, output_dir, group, names))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(recalc_group, json_dir, output_dir, group, names) for group in groups]
+            for future in as_completed(futures):
+                report.extend(future.result())
+    if not os.path.samefile(json_dir, output_dir):
+        copy_unchanged_sheets(json_dir, output_dir, {sheet for sheet, _, _, _ in report})
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m logic.recalc_workbook <json_dir> [output_dir] [workers]")
+        sys.exit(1)
+    json_dir = sys.argv[1]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    start = time.perf_counter()
+    report = recalc_workbook(json_dir, output_dir, workers)
+    for sheet, count, eval_seconds, write_seconds in sorted(report):
+        print(f"{sheet}: {count} formulas, eval {eval_seconds:.3f}s, write {write_seconds:.3f}s")
+    print(f"Recalculated {sum(r[1] for r in report)} formulas in {len(report)} sheets "
+          f"in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,302 @@
+"""
+Drivability scoring engine
+==========================
+
+Rates a project from its measured criterion ratings against the workbook
+targets, in one vectorized pass:
+
+* ``TARGETS`` gives, per operating mode and criterion, the waterline (G),
+  the target (H) and the drivability priority 1-3 (J). When a criterion is
+  listed for several drive versions the highest version wins.
+* ``cfg_criticity`` gives the points of each level (Red +, Red, Orange,
+  Jaune, Green) per priority P1-P3 and the orange/yellow threshold, a
+  relative deviation from the target.
+* ``Calculs`` gives the occurrence weight of each operating mode (column B)
+  and the "facteur Red+" (H1).
+* ``Résultats`` holds the measured ratings (A: operating mode, B: criterion,
+  C: rating) on the same scale as the targets. A column headed "Project" (or
+  "Projet", "project_id") keys each row by project id. Without one, the sheet
+  holds the measurements of the workbook's single project, and that one
+  score applies to any project rated from it.
+
+A criterion at or above its target is GREEN; below the target it is YELLOW
+while its relative deviation stays above the orange/yellow threshold and
+ORANGE after that. Below the waterline it is RED, or RED+ once the relative
+deviation from the waterline exceeds "facteur Red+" times the threshold.
+The drivability score is the occurrence-weighted share of the maximum points
+(in %), over the criteria that have a measurement.
+
+The sheets are loaded into aligned NumPy arrays once per folder (and again
+only when one of the files changes), so scoring a project is a handful of
+array operations whatever the number of criteria.
+"""
+
+import os
+
+import numpy as np
+
+from logic.sheet_cache import load_sheet
+
+LEVELS = ("RED+", "RED", "ORANGE", "YELLOW", "GREEN")
+RED_PLUS, RED, ORANGE, YELLOW, GREEN = range(len(LEVELS))
+PRIORITIES = ("P1", "P2", "P3")
+
+SCORING_SHEETS = ("TARGETS", "cfg_criticity", "Calculs")
+RESULTS_SHEET = "Résultats"
+PROJECT_HEADERS = ("project", "projet", "project id", "project_id", "id projet")
+
+# Defaults used when cfg_criticity / Calculs lack a value (same as the shipped sheets).
+DEFAULT_POINTS = ((1, 1, 2), (1, 2, 3), (2, 3, 4), (3, 4, 4), (5, 5, 5))
+DEFAULT_YELLOW_THRESHOLD = (-0.16, -0.16, -0.1)
+DEFAULT_RED_PLUS_FACTOR = 2.0
+
+# json_dir -> (file signature, ScoringModel)
+_models = {}
+# json_dir -> (file signature, {project_id: results})
+_results = {}
+
+
+def _grid(sheet):
+    """``{(row, col): value}`` of a SparseSheet."""
+    return {(row, col): value for row, col, value, _ in sheet.iter_cells()}
+
+
+def _number(value, default=np.nan):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _version_key(version):
+    """Sort key of drive versions such as "V4.2" / "V4.6"."""
+    digits = str(version or "").lstrip("Vv")
+    try:
+        return tuple(int(part) for part in digits.split("."))
+    except ValueError:
+        return ()
+
+
+class ScoringModel:
+    """Targets, weights and criticity points as aligned arrays (one entry per criterion)."""
+
+    __slots__ = (
+        "modes", "criteria", "index", "waterline", "target", "priority", "weight",
+        "points", "yellow_threshold", "red_plus_factor",
+    )
+
+    def __init__(self, modes, criteria, waterline, target, priority, weight,
+                 points=DEFAULT_POINTS, yellow_threshold=DEFAULT_YELLOW_THRESHOLD,
+                 red_plus_factor=DEFAULT_RED_PLUS_FACTOR):
+        self.modes = list(modes)
+        self.criteria = list(criteria)
+        self.index = {key: i for i, key in enumerate(zip(self.modes, self.criteria))}
+        self.waterline = np.asarray(waterline, dtype=np.float64)
+        self.target = np.asarray(target, dtype=np.float64)
+        self.priority = np.asarray(priority, dtype=np.intp)  # 0-based: P1 -> 0
+        self.weight = np.asarray(weight, dtype=np.float64)
+        self.points = np.asarray(points, dtype=np.float64)  # [level, priority]
+        self.yellow_threshold = np.asarray(yellow_threshold, dtype=np.float64)
+        self.red_plus_factor = float(red_plus_factor)
+
+    def __len__(self):
+        return len(self.modes)
+
+    @classmethod
+    def from_sheets(cls, targets, criticity=None, calculs=None):
+        """Build the model from the TARGETS, cfg_criticity and Calculs sheets."""
+        rows = {}
+        cells = _grid(targets)
+        for row in sorted({row for row, _ in cells if row > 1}):
+            mode, criterion = cells.get((row, 1)), cells.get((row, 2))
+            waterline, target = _number(cells.get((row, 7))), _number(cells.get((row, 8)))
+            if not mode or not criterion or np.isnan(target):
+                continue
+            key = (str(mode).strip(), str(criterion).strip())
+            version = _version_key(cells.get((row, 6)))
+            if key in rows and rows[key][0] > version:
+                continue
+            priority = int(_number(cells.get((row, 10)), 3))
+            rows[key] = (version, waterline, target, min(max(priority, 1), 3) - 1)
+
+        points = [list(p) for p in DEFAULT_POINTS]
+        yellow_threshold = list(DEFAULT_YELLOW_THRESHOLD)
+        if criticity is not None:
+            cells = _grid(criticity)
+            for level in range(len(LEVELS)):
+                for p in range(len(PRIORITIES)):
+                    points[level][p] = _number(cells.get((3 + level, 3 + p)), points[level][p])
+            for p in range(len(PRIORITIES)):
+                yellow_threshold[p] = _number(cells.get((8, 3 + p)), yellow_threshold[p])
+
+        occurrence = {}
+        red_plus_factor = DEFAULT_RED_PLUS_FACTOR
+        if calculs is not None:
+            cells = _grid(calculs)
+            red_plus_factor = _number(cells.get((1, 8)), red_plus_factor)
+            for (row, col), value in cells.items():
+                if col == 1 and isinstance(value, str) and value.strip().upper() != "SOMME":
+                    weight = _number(cells.get((row, 2)))
+                    if not np.isnan(weight):
+                        occurrence[value.strip()] = weight
+        # Modes without an occurrence weight count as an average mode.
+        default_weight = float(np.mean(list(occurrence.values()))) if occurrence else 1.0
+
+        keys = list(rows)
+        return cls(
+            modes=[mode for mode, _ in keys],
+            criteria=[criterion for _, criterion in keys],
+            waterline=[rows[key][1] for key in keys],
+            target=[rows[key][2] for key in keys],
+            priority=[rows[key][3] for key in keys],
+            weight=[occurrence.get(mode, default_weight) for mode, _ in keys],
+            points=points,
+            yellow_threshold=yellow_threshold,
+            red_plus_factor=red_plus_factor,
+        )
+
+    def align(self, results):
+        """Measured ratings ``{(mode, criterion): rating}`` as an array (NaN = not measured)."""
+        measured = np.full(len(self), np.nan)
+        for key, value in results.items():
+            i = self.index.get(key)
+            if i is not None:
+                measured[i] = _number(value)
+        return measured
+
+    def levels(self, measured):
+        """Level (index into LEVELS) of every criterion; unmeasured ones are GREEN."""
+        measured = np.asarray(measured, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            target_dev = (measured - self.target) / self.target
+            waterline_dev = (measured - self.waterline) / self.waterline
+        threshold = self.yellow_threshold[self.priority]
+        levels = np.full(len(self), GREEN, dtype=np.intp)
+        below_target = measured < self.target
+        levels[below_target] = np.where(target_dev >= threshold, YELLOW, ORANGE)[below_target]
+        below_waterline = measured < self.waterline
+        red_plus = waterline_dev < self.red_plus_factor * threshold
+        levels[below_waterline] = np.where(red_plus, RED_PLUS, RED)[below_waterline]
+        return levels
+
+    def score(self, measured, thresholds=None):
+        """Rate a project from its aligned measured ratings.
+
+        Returns the ``{"drivability_score", "status", "warnings"}`` dict of
+        the dashboard plus the level ``counts`` per priority (R / O / V as in
+        the totalPoint sheet). ``thresholds`` holds ``threshold_green`` and
+        ``threshold_orange`` (in %).
+        """
+        thresholds = thresholds or {}
+        measured = np.asarray(measured, dtype=np.float64)
+        valid = ~np.isnan(measured)
+        levels = self.levels(measured)
+        earned = self.points[levels, self.priority]
+        best = self.points[GREEN, self.priority]
+        weight = np.where(valid, self.weight, 0.0)
+        total = float(weight @ best)
+        score = round(100.0 * float(weight @ earned) / total, 2) if total else 0.0
+
+        counts = {}
+        for p, name in enumerate(PRIORITIES):
+            in_priority = valid & (self.priority == p)
+            counts[name + "R"] = int(np.count_nonzero(in_priority & (levels <= RED)))
+            counts[name + "O"] = int(np.count_nonzero(in_priority & ((levels == ORANGE) | (levels == YELLOW))))
+            counts[name + "V"] = int(np.count_nonzero(in_priority & (levels == GREEN)))
+
+        status = "GREEN" if score >= thresholds.get("threshold_green", 90) else \
+                 "ORANGE" if score >= thresholds.get("threshold_orange", 75) else "RED"
+        reds = int(np.count_nonzero(valid & (levels <= RED)))
+        oranges = int(np.count_nonzero(valid & (levels == ORANGE)))
+        if reds or oranges:
+            warnings = f"{reds} criteria below waterline, {oranges} far from target"
+        else:
+            warnings = "None"
+        return {
+            "drivability_score": score,
+            "status": status,
+            "warnings": warnings,
+            "measured": int(np.count_nonzero(valid)),
+            "counts": counts,
+        }
+
+
+def _signature(json_dir, names=SCORING_SHEETS):
+    signature = []
+    for name in names:
+        path = os.path.join(json_dir, name + ".json")
+        st = os.stat(path) if os.path.exists(path) else None
+        signature.append((st.st_mtime_ns, st.st_size) if st else None)
+    return tuple(signature)
+
+
+def inputs_version(json_dir):
+    """Changes whenever one of the sheets a rating depends on changes (for caching ratings)."""
+    return _signature(os.path.abspath(json_dir), SCORING_SHEETS + (RESULTS_SHEET,))
+
+
+def load_model(json_dir):
+    """ScoringModel of a sheet folder, rebuilt only when one of its sheets changes."""
+    json_dir = os.path.abspath(json_dir)
+    signature = _signature(json_dir)
+    cached = _models.get(json_dir)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    def sheet(name):
+        path = os.path.join(json_dir, name + ".json")
+        return load_sheet(path) if os.path.exists(path) else None
+
+    model = ScoringModel.from_sheets(sheet("TARGETS"), sheet("cfg_criticity"), sheet("Calculs"))
+    _models[json_dir] = (signature, model)
+    return model
+
+
+def _project_key(value):
+    number = _number(value)
+    if not np.isnan(number) and number.is_integer():
+        return int(number)
+    return str(value).strip()
+
+
+def read_project_results(json_dir):
+    """Measured ratings of the Résultats sheet as ``{project_id: {(mode, criterion): rating}}``.
+
+    Rows without a project (or all rows, when the sheet has no project
+    column) are keyed None. Re-read only when the sheet file changes.
+    """
+    json_dir = os.path.abspath(json_dir)
+    signature = _signature(json_dir, (RESULTS_SHEET,))
+    cached = _results.get(json_dir)
+    if cached and cached[0] == signature:
+        return cached[1]
+    path = os.path.join(json_dir, RESULTS_SHEET + ".json")
+    cells = _grid(load_sheet(path)) if os.path.exists(path) else {}
+    project_col = next(
+        (col for (row, col), value in cells.items()
+         if row == 1 and isinstance(value, str) and value.strip().lower() in PROJECT_HEADERS),
+        None,
+    )
+    results = {}
+    for (row, col), mode in cells.items():
+        if col != 1 or row == 1 or not mode:
+            continue
+        criterion, rating = cells.get((row, 2)), _number(cells.get((row, 3)))
+        if criterion and not np.isnan(rating):
+            project = cells.get((row, project_col)) if project_col else None
+            project = None if project is None or project == "" else _project_key(project)
+            results.setdefault(project, {})[(str(mode).strip(), str(criterion).strip())] = rating
+    _results[json_dir] = (signature, results)
+    return results
+
+
+def read_results(json_dir, project_id=None):
+    """Measured ratings ``{(mode, criterion): rating}`` of a project.
+
+    A project without rows of its own gets the sheet-wide (project-less)
+    measurements, if any.
+    """
+    results = read_project_results(json_dir)
+    return results.get(project_id) or results.get(None, {})
@@ -0,0 +1,280 @@
+"""
+Compiled sheet cache
+====================
+
+The workbook sheets are exported as ``{"cells": {"A1": {"value", "formula",
+"namedRange"}}}`` JSON files, where most cells are empty. This module compiles
+each sheet once into a compact sparse form that only keeps non-empty cells and
+persists it in a ``.sheet_cache`` directory next to the JSON files. Later loads
+reuse the compiled form as long as the source file is unchanged (same mtime,
+or same content hash when only the mtime moved).
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+from logic.a1 import column_letter, split_address
+from logic.column_store import ColumnStore
+from logic.sheet_stream import iter_sheet_cells
+
+CACHE_DIR_NAME = ".sheet_cache"
+CACHE_FORMAT = 1
+
+# In-process memo: absolute source path -> (mtime_ns, size, SparseSheet)
+_loaded = {}
+
+
+class SparseSheet:
+    """Non-empty cells of one sheet, sorted by (row, col).
+
+    ``rows`` and ``cols`` are parallel integer arrays, ``values`` holds the cell
+    values at the same positions and ``formulas`` maps a position to its formula
+    text for the (few) cells that have one. ``indexes`` holds derived lookup
+    structures (e.g. the column indexes of ``sheet_query`` or the ColumnStore
+    behind ``get_range``) built on demand and never persisted.
+    """
+
+    __slots__ = ("name", "rows", "cols", "values", "formulas", "indexes", "_row_index", "_col_numbers")
+
+    def __init__(self, name, rows, cols, values, formulas):
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.formulas = formulas
+        self.indexes = {}
+        self._row_index = None
+        self._col_numbers = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def iter_cells(self):
+        """Yield ``(row, col, value, formula)`` for every non-empty cell."""
+        formulas = self.formulas
+        for pos, value in enumerate(self.values):
+            yield self.rows[pos], self.cols[pos], value, formulas.get(pos)
+
+    def row_index(self):
+        """Return ``(row_numbers, offsets)``: the distinct non-empty rows and where each starts.
+
+        ``offsets`` has one extra trailing entry so row ``i`` spans
+        ``offsets[i]:offsets[i + 1]`` in the cell arrays.
+        """
+        if self._row_index is None:
+            row_numbers = array("i")
+            offsets = array("i")
+            previous = None
+            for pos, row in enumerate(self.rows):
+                if row != previous:
+                    row_numbers.append(row)
+                    offsets.append(pos)
+                    previous = row
+            offsets.append(len(self.rows))
+            self._row_index = (row_numbers, offsets)
+        return self._row_index
+
+    def column_numbers(self):
+        """Return the sorted distinct non-empty column numbers."""
+        if self._col_numbers is None:
+            self._col_numbers = sorted(set(self.cols))
+        return self._col_numbers
+
+    @property
+    def row_count(self):
+        return len(self.row_index()[0])
+
+    @property
+    def column_count(self):
+        return len(self.column_numbers())
+
+    def column_store(self):
+        """The cell values as a ColumnStore (typed column arrays), built on first use."""
+        store = self.indexes.get("columns")
+        if store is None:
+            store = self.indexes["columns"] = ColumnStore.from_cells(self.rows, self.cols, self.values)
+        return store
+
+    def get_range(self, reference):
+        """RangeValue of an A1 range such as "A1:K500", as views of ``column_store()``."""
+        return self.column_store().get_range(reference)
+
+    def window(self, row_start=0, row_count=None, col_start=0, col_count=None):
+        """Return ``(column_letters, records)`` for a slice of non-empty rows and columns.
+
+        ``row_start``/``col_start`` are positions among the non-empty rows and
+        columns, so paging never lands on blank pages. Each record is a dict
+        with a ``"Row"`` key plus one key per column letter.
+        """
+        total = self.row_count
+        row_stop = total if row_count is None else min(row_start + row_count, total)
+        return self.rows_window(range(row_start, row_stop), col_start, col_count)
+
+    def rows_window(self, row_positions, col_start=0, col_count=None):
+        """Like ``window`` but for an explicit sequence of row positions."""
+        row_numbers, offsets = self.row_index()
+        col_numbers = self.column_numbers()
+        col_stop = len(col_numbers) if col_count is None else col_start + col_count
+        col_numbers = col_numbers[col_start:col_stop]
+        letters = [column_letter(col) for col in col_numbers]
+        records = []
+        if not col_numbers:
+            return letters, records
+        first_col, last_col = col_numbers[0], col_numbers[-1]
+        for i in row_positions:
+            record = {"Row": str(row_numbers[i])}
+            record.update(dict.fromkeys(letters))
+            lo = bisect_left(self.cols, first_col, offsets[i], offsets[i + 1])
+            hi = bisect_right(self.cols, last_col, lo, offsets[i + 1])
+            for pos in range(lo, hi):
+                record[column_letter(self.cols[pos])] = self.values[pos]
+            records.append(record)
+        return letters, records
+
+
+def compile_sheet(path, name=None, digest=None):
+    """Stream a JSON sheet export into a SparseSheet, dropping empty cells.
+
+    Cells are appended straight into the compact arrays, so memory grows with
+    the non-empty cells only. ``digest`` (a hashlib object) is fed the file
+    bytes during the same pass.
+    """
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    rows = array("i")
+    cols = array("i")
+    values = []
+    formulas = {}
+    in_order = True
+    last = (0, 0)
+    for address, value, formula in iter_sheet_cells(path, digest=digest):
+        pos = split_address(address)
+        if pos is None:
+            continue
+        if pos < last:
+            in_order = False
+        last = pos
+        if formula:
+            formulas[len(values)] = formula
+        rows.append(pos[0])
+        cols.append(pos[1])
+        values.append(value)
+    if not in_order:
+        order = sorted(range(len(values)), key=lambda i: (rows[i], cols[i]))
+        formulas = {new: formulas[old] for new, old in enumerate(order) if old in formulas}
+        rows = array("i", (rows[i] for i in order))
+        cols = array("i", (cols[i] for i in order))
+        values = [values[i] for i in order]
+    return SparseSheet(name, rows, cols, values, formulas)
+
+
+def file_digest(path):
+    """Return the SHA-1 hex digest of a file, read in 1 MB chunks."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(path, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    return os.path.join(cache_dir, os.path.basename(path) + ".pkl")
+
+
+def _read_cache(cache_path):
+    """Return ``(meta, file)`` with the file positioned at the payload, or (None, None)."""
+    try:
+        f = open(cache_path, "rb")
+    except OSError:
+        return None, None
+    try:
+        meta = pickle.load(f)
+        if meta.get("format") == CACHE_FORMAT:
+            return meta, f
+    except Exception:
+        pass
+    f.close()
+    return None, None
+
+
+def _write_cache(cache_path, meta, sheet):
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        # A private temporary file per write: concurrent writers of the same
+        # sheet each replace the cache with a complete file.
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=os.path.basename(cache_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(
+                    (sheet.name, sheet.rows, sheet.cols, sheet.values, sheet.formulas),
+                    f, protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        # A read-only data folder only costs us the persistent cache.
+        print(f"Could not write sheet cache {cache_path}: {e}")
+
+
+def load_sheet(path, cache_dir=None):
+    """Load one JSON sheet, using the compiled cache whenever it is still valid."""
+    abs_path = os.path.abspath(path)
+    st = os.stat(abs_path)
+    memo = _loaded.get(abs_path)
+    if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+        return memo[2]
+
+    cache_path = _cache_path(abs_path, cache_dir)
+    meta, f = _read_cache(cache_path)
+    sheet = None
+    if meta is not None:
+        with f:
+            same_stat = meta["mtime_ns"] == st.st_mtime_ns and meta["size"] == st.st_size
+            if same_stat or meta["sha1"] == file_digest(abs_path):
+                try:
+                    sheet = SparseSheet(*pickle.load(f))
+                except (EOFError, pickle.UnpicklingError, TypeError, ValueError, AttributeError) as e:
+                    # Truncated or stale cache: compiled again and rewritten below.
+                    print(f"Ignoring unreadable sheet cache {cache_path}: {e}")
+        if sheet is not None and not same_stat:
+            # Touched but unchanged: refresh the stored stat so the hash is skipped next time.
+            meta.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            _write_cache(cache_path, meta, sheet)
+
+    if sheet is None:
+        digest = hashlib.sha1()
+        sheet = compile_sheet(abs_path, digest=digest)
+        meta = {
+            "format": CACHE_FORMAT,
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha1": digest.hexdigest(),
+        }
+        _write_cache(cache_path, meta, sheet)
+
+    _loaded[abs_path] = (st.st_mtime_ns, st.st_size, sheet)
+    return sheet
+
+
+def sheet_files(json_dir):
+    """Return the sorted JSON sheet file names of a directory."""
+    return sorted(f for f in os.listdir(json_dir) if f.endswith(".json"))
+
+
+def load_sheets(json_dir, cache_dir=None):
+    """Load every JSON sheet of a directory as ``[(sheet_name, SparseSheet)]``."""
+    sheets = []
+    for fname in sheet_files(json_dir):
+        sheet = load_sheet(os.path.join(json_dir, fname), cache_dir)
+        sheets.append((sheet.name, sheet))
+    return sheets
@@ -0,0 +1,348 @@
+"""
+Server-side filtering and sorting for sheet tables
+==================================================
+
+Translates DataTable ``filter_query`` / ``sort_by`` values (as sent with
+``filter_action="custom"`` and ``sort_action="custom"``) into either
+
+* predicates evaluated against per-column indexes of a compiled JSON sheet
+  (see ``sheet_cache.SparseSheet``), or
+* a parameterized SQL ``WHERE`` / ``ORDER BY`` clause for SQLite tables.
+
+Only the rows of the requested page leave the server.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+
+from logic.a1 import COLUMN_RE, column_index
+
+_OPERATOR_ALIASES = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+
+_TERM_RE = re.compile(
+    r"^\{(?P<col>[^}]+)\}\s*"
+    r"(?P<op>[si]?(?:eq|ne|lt|le|gt|ge|contains|datestartswith)\b|!=|<=|>=|=|<|>"
+    r"|is\s+(?:not\s+)?(?:blank|nil|num|str)\b)"
+    r"\s*(?P<value>.*)$"
+)
+
+
+class Condition:
+    """One ``{column} operator value`` term of a filter query."""
+
+    __slots__ = ("column", "operator", "value", "case_sensitive")
+
+    def __init__(self, column, operator, value, case_sensitive=True):
+        self.column = column
+        self.operator = operator
+        self.value = value
+        self.case_sensitive = case_sensitive
+
+    def __repr__(self):
+        return f"Condition({self.column!r}, {self.operator!r}, {self.value!r})"
+
+
+_TEXT_OPERATORS = ("contains", "datestartswith")
+
+
+def _parse_value(text, numeric=True):
+    """Value of a term: unquoted text, or a float when ``numeric`` and it reads as one.
+
+    Text operators pass ``numeric=False`` so ``contains 5`` looks for "5", not "5.0".
+    """
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'`":
+        return text[1:-1]
+    if not numeric:
+        return text
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def parse_filter_query(filter_query):
+    """Split a DataTable filter query into a list of Conditions (AND-ed together).
+
+    Terms that cannot be parsed are ignored, like the DataTable UI does.
+    """
+    conditions = []
+    if not filter_query:
+        return conditions
+    for part in filter_query.split(" && "):
+        match = _TERM_RE.match(part.strip())
+        if not match:
+            continue
+        op = " ".join(match.group("op").split())
+        case_sensitive = True
+        if op.startswith("is "):
+            value = None
+        else:
+            op = _OPERATOR_ALIASES.get(op, op)
+            if op[0] in "si" and op[1:] in ("eq", "ne", "lt", "le", "gt", "ge", "contains", "datestartswith"):
+                case_sensitive = op[0] == "s"
+                op = op[1:]
+            value = _parse_value(match.group("value"), numeric=op not in _TEXT_OPERATORS)
+        conditions.append(Condition(match.group("col"), op, value, case_sensitive))
+    return conditions
+
+
+# --- JSON sheets: per-column indexes --------------------------------------
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class ColumnIndex:
+    """Index of one sheet column over the sheet's non-empty row positions.
+
+    ``numbers``/``number_rows`` are the numeric cells sorted by value for range
+    predicates; ``by_value`` maps each exact value to its row positions.
+    """
+
+    __slots__ = ("values", "numbers", "number_rows", "by_value")
+
+    def __init__(self, cells):
+        self.values = dict(cells)
+        numeric = sorted((float(v), pos) for pos, v in cells if _is_number(v))
+        self.numbers = [n for n, _ in numeric]
+        self.number_rows = [pos for _, pos in numeric]
+        self.by_value = {}
+        for pos, value in cells:
+            key = float(value) if _is_number(value) else value
+            self.by_value.setdefault(key, []).append(pos)
+
+    def _text_match(self, cond, test):
+        needle = str(cond.value)
+        if not cond.case_sensitive:
+            needle = needle.lower()
+        matches = set()
+        for pos, value in self.values.items():
+            text = str(value)
+            if not cond.case_sensitive:
+                text = text.lower()
+            if test(text, needle):
+                matches.add(pos)
+        return matches
+
+    def _range(self, op, bound):
+        lo, hi = 0, len(self.numbers)
+        if op == "lt":
+            hi = bisect_left(self.numbers, bound)
+        elif op == "le":
+            hi = bisect_right(self.numbers, bound)
+        elif op == "gt":
+            lo = bisect_right(self.numbers, bound)
+        else:
+            lo = bisect_left(self.numbers, bound)
+        return set(self.number_rows[lo:hi])
+
+    def match(self, cond, all_rows):
+        """Return the set of row positions matching ``cond``."""
+        op, value = cond.operator, cond.value
+        if op.startswith("is "):
+            negate = " not " in op
+            kind = op.split()[-1]
+            if kind in ("blank", "nil"):
+                found = {pos for pos, v in self.values.items() if v != ""}
+                return found if negate else all_rows - found
+            check = _is_number if kind == "num" else (lambda v: isinstance(v, str))
+            found = {pos for pos, v in self.values.items() if check(v)}
+            return all_rows - found if negate else found
+        if op in ("eq", "ne"):
+            if _is_number(value):
+                found = set(self.by_value.get(float(value), ()))
+            elif cond.case_sensitive:
+                found = set(self.by_value.get(value, ()))
+            else:
+                found = self._text_match(cond, lambda text, needle: text == needle)
+            return all_rows - found if op == "ne" else found
+        if op in ("lt", "le", "gt", "ge"):
+            if _is_number(value):
+                return self._range(op, float(value))
+            compare = {"lt": str.__lt__, "le": str.__le__, "gt": str.__gt__, "ge": str.__ge__}[op]
+            return self._text_match(cond, lambda text, needle: compare(text, needle))
+        if op == "contains":
+            return self._text_match(cond, lambda text, needle: needle in text)
+        if op == "datestartswith":
+            return self._text_match(cond, lambda text, needle: text.startswith(needle))
+        return all_rows
+
+
+def _column_cells(sheet, column_id):
+    """Collect ``(row_position, value)`` pairs of one column of a SparseSheet."""
+    row_numbers, offsets = sheet.row_index()
+    if column_id == "Row":
+        return list(enumerate(row_numbers))
+    col = column_index(column_id)
+    cells = []
+    for i in range(len(row_numbers)):
+        lo = bisect_left(sheet.cols, col, offsets[i], offsets[i + 1])
+        if lo < offsets[i + 1] and sheet.cols[lo] == col:
+            cells.append((i, sheet.values[lo]))
+    return cells
+
+
+def column_index_for(sheet, column_id):
+    """Return (and memoize on the sheet) the ColumnIndex of a column.
+
+    ``column_id`` comes from the browser: anything but "Row" or column
+    letters is an empty column, and is neither indexed nor memoized.
+    """
+    if column_id != "Row" and not (isinstance(column_id, str) and COLUMN_RE.match(column_id)):
+        return ColumnIndex(())
+    indexes = sheet.indexes
+    key = ("column", column_id)
+    index = indexes.get(key)
+    if index is None:
+        index = indexes[key] = ColumnIndex(_column_cells(sheet, column_id))
+    return index
+
+
+def _sort_key(value):
+    if value is None or value == "":
+        return (2, 0)
+    if _is_number(value):
+        return (0, float(value))
+    return (1, str(value))
+
+
+def query_sheet_rows(sheet, filter_query=None, sort_by=None):
+    """Return the row positions of a SparseSheet matching a filter, in sort order."""
+    row_count = sheet.row_count
+    rows = None
+    all_rows = None
+    for cond in parse_filter_query(filter_query):
+        if all_rows is None:
+            all_rows = set(range(row_count))
+        matched = column_index_for(sheet, cond.column).match(cond, all_rows)
+        rows = matched if rows is None else rows & matched
+        if not rows:
+            break
+    rows = list(range(row_count)) if rows is None else sorted(rows)
+    for sort in reversed(sort_by or []):
+        values = column_index_for(sheet, sort["column_id"]).values
+        rows.sort(key=lambda pos: _sort_key(values.get(pos)), reverse=sort.get("direction") == "desc")
+    return rows
+
+
+def query_sheet_window(sheet, page_current=0, page_size=20, filter_query=None, sort_by=None,
+                       col_start=0, col_count=None):
+    """Filter, sort and page a SparseSheet.
+
+    Returns ``(column_letters, records, page_count)`` for the requested page.
+    """
+    if not filter_query and not sort_by:
+        row_positions = None
+        total = sheet.row_count
+    else:
+        row_positions = query_sheet_rows(sheet, filter_query, sort_by)
+        total = len(row_positions)
+    page_count = max(1, -(-total // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    start = page_current * page_size
+    if row_positions is None:
+        row_positions = range(start, min(start + page_size, total))
+    else:
+        row_positions = row_positions[start:start + page_size]
+    letters, records = sheet.rows_window(row_positions, col_start, col_count)
+    return letters, records, page_count
+
+
+# --- SQLite tables ---------------------------------------------------------
+
+def quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _column_sql(name, columns):
+    # A column the table does not have reads as NULL, like an empty column on the JSON path.
+    return quote_identifier(name) if columns is None or name in columns else "NULL"
+
+
+def sql_where(conditions, columns=None):
+    """Translate Conditions into a ``(where_clause, params)`` pair ("" when empty).
+
+    With ``columns`` (the table's column names), terms on other columns
+    compare against NULL instead of producing invalid SQL.
+    """
+    clauses = []
+    params = []
+    for cond in conditions:
+        col = _column_sql(cond.column, columns)
+        op, value = cond.operator, cond.value
+        if op.startswith("is "):
+            negate = " not " in op
+            kind = op.split()[-1]
+            if kind in ("blank", "nil"):
+                clause = f"({col} IS NULL OR {col} = '')"
+            elif kind == "num":
+                clause = f"typeof({col}) IN ('integer', 'real')"
+            else:
+                clause = f"typeof({col}) = 'text'"
+            clauses.append(f"NOT {clause}" if negate else clause)
+            continue
+        if op in _TEXT_OPERATORS:
+            pattern = _escape_like(str(value)) + "%"
+            if op == "contains":
+                pattern = "%" + pattern
+            if cond.case_sensitive:
+                # LIKE ignores case in SQLite, so case-sensitive terms use instr/substr.
+                if op == "contains":
+                    clauses.append(f"instr({col}, ?) > 0")
+                else:
+                    clauses.append(f"substr({col}, 1, ?) = ?")
+                    params.append(len(str(value)))
+                params.append(str(value))
+            else:
+                clauses.append(f"{col} LIKE ? ESCAPE '\\'")
+                params.append(pattern)
+            continue
+        sql_op = {"eq": "=", "ne": "!=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}[op]
+        if isinstance(value, str) and not cond.case_sensitive:
+            clauses.append(f"lower({col}) {sql_op} lower(?)")
+        elif op == "ne":
+            clauses.append(f"({col} IS NULL OR {col} {sql_op} ?)")
+        else:
+            clauses.append(f"{col} {sql_op} ?")
+        params.append(value)
+    if not clauses:
+        return "", params
+    return " WHERE " + " AND ".join(clauses), params
+
+
+def sql_order_by(sort_by, columns=None):
+    """Translate a DataTable ``sort_by`` list into an ``ORDER BY`` clause (unknown columns are skipped)."""
+    terms = [
+        f"{quote_identifier(s['column_id'])} {'DESC' if s.get('direction') == 'desc' else 'ASC'}"
+        for s in sort_by or []
+        if columns is None or s["column_id"] in columns
+    ]
+    if not terms:
+        return ""
+    return " ORDER BY " + ", ".join(terms)
+
+
+def query_table_page(conn, table, page_current=0, page_size=20, filter_query=None, sort_by=None):
+    """Run a filtered, sorted page query against a SQLite table.
+
+    Returns ``(records, page_count)``. Filter and sort terms may name
+    columns the table does not have (they come from the browser); see
+    ``sql_where``.
+    """
+    source = quote_identifier(table)
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({source})")}
+    where, params = sql_where(parse_filter_query(filter_query), columns)
+    total = conn.execute(f"SELECT count(*) FROM {source}{where}", params).fetchone()[0]
+    page_count = max(1, -(-total // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    cur = conn.execute(
+        f"SELECT * FROM {source}{where}{sql_order_by(sort_by, columns)} LIMIT ? OFFSET ?",
+        params + [page_size, page_current * page_size],
+    )
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()], page_count
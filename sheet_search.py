@@ -0,0 +1,212 @@
+"""
+Workbook search index
+=====================
+
+Inverted index over the cell values of every JSON sheet export, so a label or
+parameter can be found across all sheets without opening them one by one.
+Each sheet keeps its own index, built once from the compiled sheet (see
+``sheet_cache``) and rebuilt only when that sheet's file changes. Only the
+sheets a search may return are indexed, and ``start_background_index``
+builds them off the request thread (at startup, or when sheets are
+unlocked). Lookups are dictionary hits and set intersections, a few
+milliseconds for the whole workbook.
+
+Text is matched case- and accent-insensitively ("resultats" finds
+"Résultats"). Three modes:
+
+* ``word``: every word of the query appears as a whole word in the cell;
+* ``prefix``: every word of the query starts a word of the cell;
+* ``substring``: the query appears anywhere in the cell, found through a
+  trigram index and then checked on the candidate cells.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from logic.a1 import format_address
+from logic.sheet_cache import load_sheet, sheet_files
+
+SEARCH_MODES = ("word", "prefix", "substring")
+SEARCH_LIMIT = 200
+
+_WORD_RE = re.compile(r"\w+")
+
+# json_dir -> WorkbookIndex
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def normalize(value):
+    """Text of a cell value for matching: case-folded, without accents."""
+    text = unicodedata.normalize("NFKD", str(value).casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SheetIndex:
+    """Word and trigram postings of the non-empty cells of one sheet.
+
+    Postings are arrays of positions into ``addresses``/``values``, which
+    follow the (row, col) order of the sheet.
+    """
+
+    __slots__ = ("name", "signature", "addresses", "values", "texts", "words", "word_list", "grams")
+
+    def __init__(self, name, signature, sheet):
+        self.name = name
+        self.signature = signature
+        self.addresses = []
+        self.values = []
+        self.texts = []
+        self.words = {}
+        self.grams = {}
+        for row, col, value, _ in sheet.iter_cells():
+            if value is None or value == "":
+                continue
+            pos = len(self.values)
+            text = normalize(value)
+            self.addresses.append(format_address(row, col))
+            self.values.append(value)
+            self.texts.append(text)
+            for word in set(_WORD_RE.findall(text)):
+                self.words.setdefault(word, array("i")).append(pos)
+            for gram in trigrams(text):
+                self.grams.setdefault(gram, array("i")).append(pos)
+        self.word_list = sorted(self.words)
+
+    def _prefix_positions(self, prefix):
+        positions = set()
+        words, word_list = self.words, self.word_list
+        for i in range(bisect_left(word_list, prefix), len(word_list)):
+            if not word_list[i].startswith(prefix):
+                break
+            positions.update(words[word_list[i]])
+        return positions
+
+    def _substring_positions(self, term):
+        if len(term) < 3:
+            return {pos for pos, text in enumerate(self.texts) if term in text}
+        candidates = None
+        for gram in trigrams(term):
+            postings = self.grams.get(gram)
+            if not postings:
+                return set()
+            candidates = set(postings) if candidates is None else candidates.intersection(postings)
+        return {pos for pos in candidates if term in self.texts[pos]}
+
+    def match(self, terms, mode="word"):
+        """Sorted positions of the cells matching all ``terms`` (normalized) in ``mode``."""
+        result = None
+        for term in terms:
+            if mode == "word":
+                positions = set(self.words.get(term, ()))
+            elif mode == "prefix":
+                positions = self._prefix_positions(term)
+            else:
+                positions = self._substring_positions(term)
+            result = positions if result is None else result & positions
+            if not result:
+                return []
+        return sorted(result or ())
+
+
+class WorkbookIndex:
+    """Search index over the sheet exports of a folder, kept in step with the files."""
+
+    def __init__(self, json_dir):
+        self.json_dir = json_dir
+        self.sheets = {}  # sheet name -> SheetIndex, in sheet file order
+        self._lock = threading.Lock()
+
+    def refresh(self, names=None):
+        """Re-index the sheets whose file changed since the last call; return their names.
+
+        ``names`` limits the refresh to some sheets; the others keep the
+        index they have, if any.
+        """
+        with self._lock:
+            files = [f[:-len(".json")] for f in sheet_files(self.json_dir)]
+            wanted = set(files if names is None else names)
+            sheets, changed = {}, []
+            for name in files:
+                index = self.sheets.get(name)
+                if name in wanted:
+                    path = os.path.join(self.json_dir, name + ".json")
+                    st = os.stat(path)
+                    signature = (st.st_mtime_ns, st.st_size)
+                    if index is None or index.signature != signature:
+                        index = SheetIndex(name, signature, load_sheet(path))
+                        changed.append(name)
+                if index is not None:
+                    sheets[name] = index
+            self.sheets = sheets
+            return changed
+
+    def search(self, query, mode="word", limit=SEARCH_LIMIT, sheets=None):
+        """Return up to ``limit`` ``(sheet, address, value)`` hits for ``query``, in sheet order.
+
+        ``sheets`` restricts the search (and the indexing it triggers) to
+        some sheet names.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        text = normalize(query or "").strip()
+        terms = [text] if mode == "substring" else _WORD_RE.findall(text)
+        if not terms or not terms[0]:
+            return []
+        self.refresh(sheets)
+        hits = []
+        for name, index in self.sheets.items():
+            if sheets is not None and name not in sheets:
+                continue
+            for pos in index.match(terms, mode):
+                hits.append((name, index.addresses[pos], index.values[pos]))
+                if len(hits) >= limit:
+                    return hits
+        return hits
+
+
+def get_index(json_dir):
+    """The (process-wide) WorkbookIndex of a sheet folder."""
+    key = os.path.abspath(json_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = WorkbookIndex(key)
+    return index
+
+
+def start_background_index(json_dir, names=None):
+    """Index the sheets ``names`` (all by default) of ``json_dir`` in a daemon thread."""
+    def run():
+        start = time.perf_counter()
+        try:
+            changed = get_index(json_dir).refresh(names)
+            print(f"Search index: {len(changed)} sheets indexed in {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            print(f"Search index failed: {e}")
+    thread = threading.Thread(target=run, name="odriv-search-index", daemon=True)
+    thread.start()
+    return thread
+
+
+def search_sheets(json_dir, query, mode="word", limit=SEARCH_LIMIT):
+    """Search all sheet exports of ``json_dir``; see ``WorkbookIndex.search``."""
+    return get_index(json_dir).search(query, mode, limit)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python -m logic.sheet_search <json_dir> <query> [word|prefix|substring]")
+        sys.exit(1)
+    for sheet, address, value in search_sheets(sys.argv[1], sys.argv[2], *sys.argv[3:4]):
+        print(f"{sheet}!{address}: {value}")
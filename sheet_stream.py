@@ -0,0 +1,147 @@
+"""
+Streaming reader for JSON sheet exports
+=======================================
+
+``json.load`` on a multi-megabyte sheet export materializes every cell dict,
+most of them empty, before anything can be skipped. ``iter_sheet_cells`` reads
+the file in fixed-size chunks instead and decodes the ``"cells"`` object one
+entry at a time, so peak memory depends on the chunk size and not on the size
+of the sheet. Callers consume the cells as they come, usually in batches (see
+``iter_batches``).
+"""
+
+import codecs
+import json
+import re
+from itertools import islice
+
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 5000
+
+_SKIP_WHITESPACE = re.compile(r"[ \t\n\r]*").match
+# Fast paths for the common shapes; anything else falls back to the JSON decoder.
+_MATCH_KEY = re.compile(r'"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*').match
+_MATCH_EMPTY_CELL = re.compile(
+    r'\{\s*"value"\s*:\s*null\s*,\s*"formula"\s*:\s*null\s*,\s*"namedRange"\s*:\s*null\s*\}'
+).match
+
+
+class _ChunkReader:
+    """Text buffer over a binary file that is refilled on demand."""
+
+    def __init__(self, f, chunk_size, digest):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.digest = digest
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk to the buffer; return False at end of file."""
+        if self.eof:
+            return False
+        data = self.f.read(self.chunk_size)
+        if self.digest is not None:
+            self.digest.update(data)
+        if not data:
+            self.eof = True
+            self.buf += self.decoder.decode(b"", final=True)
+            return False
+        if self.pos > len(self.buf) // 2:
+            # Drop what has already been consumed so the buffer stays bounded.
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += self.decoder.decode(data)
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ("" at EOF)."""
+        while True:
+            buf = self.buf
+            pos = self.pos = _SKIP_WHITESPACE(buf, self.pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of sheet JSON")
+        self.pos += 1
+
+    def decode(self, decoder):
+        """Decode the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof:
+                # A number may continue in the next chunk; make sure it is complete.
+                if self.fill():
+                    continue
+            self.pos = end
+            return value
+
+    def drain(self):
+        """Read the rest of the file (so a running digest covers all of it)."""
+        while self.fill():
+            self.pos = len(self.buf)
+
+
+def iter_sheet_cells(path, skip_empty=True, digest=None, chunk_size=CHUNK_SIZE):
+    """Yield ``(address, value, formula)`` for the cells of a sheet export.
+
+    Cells with neither a value nor a formula are skipped unless ``skip_empty``
+    is False. When ``digest`` (a hashlib object) is given it is fed the raw file
+    bytes, so a content hash comes for free with the parse.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        reader = _ChunkReader(f, chunk_size, digest)
+        reader.expect("{")
+        while reader.peek() not in ("}", ""):
+            key = reader.decode(decoder)
+            reader.expect(":")
+            if key != "cells":
+                reader.decode(decoder)
+            else:
+                reader.expect("{")
+                while reader.peek() != "}":
+                    match = _MATCH_KEY(reader.buf, reader.pos)
+                    if match:
+                        address = match.group(1)
+                        reader.pos = match.end()
+                    else:
+                        address = reader.decode(decoder)
+                        reader.expect(":")
+                    match = skip_empty and _MATCH_EMPTY_CELL(reader.buf, reader.pos)
+                    if match:
+                        reader.pos = match.end()
+                    else:
+                        cell = reader.decode(decoder) or {}
+                        value = cell.get("value")
+                        formula = cell.get("formula")
+                        if not (skip_empty and value is None and not formula):
+                            yield address, value, formula
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                reader.pos += 1
+            if reader.peek() == ",":
+                reader.pos += 1
+        reader.drain()
+
+
+def iter_batches(iterable, size=BATCH_SIZE):
+    """Group an iterable into lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,123 @@
+"""
+Summary block functions
+=======================
+
+Native versions of the workbook's VBA functions ``powerSummCells`` and
+``calculSummCells``. The sheets list operation modes in blocks, each closed
+by a "SOMME" row whose formula sums the occurrence column of the block::
+
+    A80: SOMME    B80: =powerSummCells(A80, NOW())
+    A72: Somme    B72: =calculSummCells(NOW())
+
+The "SOMME" rows are found by comparing the pooled text codes of the label
+column. The summed column is read once per data change, block by block
+between those rows, into an array kept in the evaluation context's memo
+(``ctx.memo``). Each formula is then one lookup: recalculating
+a sheet full of these formulas reads its columns once, not once per formula.
+The memo grows down the sheet as anchors ask for it, so a formula never
+reads rows below its own anchor.
+The ``NOW()`` argument only exists to make Excel call the functions on every
+recalculation; here it is not evaluated at all. The formulas stay volatile
+(recalculated on every pass) and simply hit the memo while the data is the
+same.
+"""
+
+from array import array
+from bisect import bisect_right
+
+import numpy as np
+
+from logic.formulas import CellRef, FormulaError, RangeRef, register_function
+
+SUMMARY_LABEL = "SOMME"
+
+
+def _is_summary_label(text):
+    return isinstance(text, str) and text.strip().upper() == SUMMARY_LABEL
+
+
+class _BlockSums:
+    """Values of one column with its "SOMME" label rows, read down to ``rows_read``.
+
+    ``column[i]`` is the value of row ``i + 1`` (0 for non-numeric cells and
+    summary rows) and ``summary_rows`` the sorted 1-based summary rows.
+    """
+
+    __slots__ = ("label_col", "value_col", "rows_read", "column", "summary_rows")
+
+    def __init__(self, label_col, value_col):
+        self.label_col = label_col
+        self.value_col = value_col
+        self.rows_read = 0
+        self.column = array("d")
+        self.summary_rows = []
+
+    def _extend(self, ctx, anchor, last):
+        first = self.rows_read + 1
+        labels = ctx.range(RangeRef(anchor.book, anchor.sheet, first, self.label_col, last, self.label_col))
+        codes, pool = labels.text_codes()
+        summary_ids = [code for code, text in enumerate(pool) if _is_summary_label(text)]
+        summary = (np.flatnonzero(np.isin(codes[:, 0], summary_ids)) + first).tolist()
+        # Read the blocks between summary rows only: a summary row holds a
+        # summary formula, which must not be evaluated from here.
+        column, start = self.column, first
+        for stop in summary + [last + 1]:
+            if start < stop:
+                numbers, mask = ctx.range(
+                    RangeRef(anchor.book, anchor.sheet, start, self.value_col, stop - 1, self.value_col)
+                ).numeric()
+                column.frombytes(np.where(mask[:, 0], numbers[:, 0], 0.0).tobytes())
+            if stop <= last:
+                column.append(0.0)
+            start = stop + 1
+        self.summary_rows.extend(summary)
+        self.rows_read = last
+
+    def block_sum(self, ctx, anchor):
+        """Sum of the block that ends at ``anchor.row - 1``."""
+        last = anchor.row - 1
+        if last > self.rows_read:
+            self._extend(ctx, anchor, last)
+        i = bisect_right(self.summary_rows, last)
+        previous = self.summary_rows[i - 1] if i else 0
+        return float(np.frombuffer(self.column, dtype=np.float64)[previous:last].sum())
+
+
+def summary_sum(ctx, anchor, label_col, value_col):
+    """Sum ``value_col`` over the block that ends at ``anchor.row``.
+
+    The block starts after the previous row whose ``label_col`` cell reads
+    "SOMME" (or at the top of the sheet). Contexts without a ``memo`` read
+    the rows above the anchor on every call.
+    """
+    if anchor.row < 2:
+        return 0.0
+    memo = ctx.memo(anchor) if hasattr(ctx, "memo") else {}
+    key = ("summary", label_col, value_col)
+    blocks = memo.get(key)
+    if blocks is None:
+        blocks = memo[key] = _BlockSums(label_col, value_col)
+    return blocks.block_sum(ctx, anchor)
+
+
+def _anchor(ctx, arg):
+    ref = getattr(arg, "ref", None)
+    if not isinstance(ref, CellRef):
+        raise FormulaError("#VALUE!", "powerSummCells expects a cell reference")
+    return ref
+
+
+@register_function("powerSummCells", lazy=True)
+def power_summ_cells(ctx, anchor, trigger=None):
+    """``=powerSummCells(A80, NOW())``: sum of the column right of the anchor label."""
+    ref = _anchor(ctx, anchor)
+    return summary_sum(ctx, ref, ref.col, ref.col + 1)
+
+
+@register_function("calculSummCells", lazy=True)
+def calcul_summ_cells(ctx, trigger=None):
+    """``=calculSummCells(NOW())``: sum of the calling cell's column, labels in column A."""
+    caller = getattr(ctx, "caller", None)
+    if caller is None:
+        raise FormulaError("#VALUE!", "calculSummCells needs the calling cell")
+    return summary_sum(ctx, caller, 1, caller.col)
@@ -0,0 +1,37 @@
+"""
+Test setup
+==========
+
+The dashboard is deployed as a package named ``logic`` with a ``data``
+folder beside it holding ``odriv.db`` (see ``db.DB_PATH``) and the
+``json_sheets`` exports read by ``app``, relative to the working directory.
+The tests rebuild that layout in a temporary folder and run from it: a
+``logic`` link to this checkout, a copy of the checked-in ``odriv.db`` and
+an empty ``json_sheets`` folder, so no test writes to the repository.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_layout = tempfile.mkdtemp(prefix="odriv-tests-")
+atexit.register(shutil.rmtree, _layout, ignore_errors=True)
+os.symlink(PACKAGE_DIR, os.path.join(_layout, "logic"))
+os.makedirs(os.path.join(_layout, "data", "json_sheets"))
+shutil.copy(os.path.join(PACKAGE_DIR, "odriv.db"), os.path.join(_layout, "data", "odriv.db"))
+sys.path.insert(0, _layout)
+os.chdir(_layout)
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """Path of a fresh copy of the checked-in (unmigrated) odriv.db."""
+    path = tmp_path / "odriv.db"
+    shutil.copy(os.path.join(PACKAGE_DIR, "odriv.db"), path)
+    return path
@@ -0,0 +1,44 @@
+import pytest
+
+from logic.a1 import column_index, column_letter, parse_range, split_address
+from logic.cell_store import connect, import_json_sheets, parse_reference, read_cell, read_range
+
+from test_workbook import write_sheets
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("Data!B7", ("Data", 7, 2, 7, 2)),
+    ("Data!$B$7:$A$2", ("Data", 2, 1, 7, 2)),
+    ("'My ''big'' sheet'!a1:k500", ("My 'big' sheet", 1, 1, 500, 11)),
+    ("XFD1048576", ("Home", 1048576, 16384, 1048576, 16384)),
+])
+def test_parse_reference(reference, expected):
+    assert parse_reference(reference, default_sheet="Home") == expected
+
+
+@pytest.mark.parametrize("reference", ["Data!ABCD12", "Data!A1:ABCD2", "Data!A", "Data!12", "A1"])
+def test_parse_reference_rejects_malformed_references(reference):
+    with pytest.raises(ValueError):
+        parse_reference(reference)
+
+
+def test_a1_codec_round_trips():
+    for col in (1, 26, 27, 702, 703, 16384):
+        assert column_index(column_letter(col)) == col
+    assert split_address("$AB$12") == (12, 28)
+    assert split_address("ABCD1") is None
+    assert parse_range("C3:A1") == (1, 1, 3, 3)
+    with pytest.raises(ValueError):
+        parse_range("A1:ABCD2")
+
+
+def test_imported_sheets_are_read_back(tmp_path):
+    write_sheets(tmp_path, {"Data": {"A1": 1, "B2": "x", "C1": "=A1*2"}})
+    db_path = str(tmp_path / "cells.db")
+    import_json_sheets(tmp_path, db_path)
+    conn = connect(db_path)
+    try:
+        assert read_range(conn, "Data!A1:B2") == [[1, None], [None, "x"]]
+        assert read_cell(conn, "B2", default_sheet="Data") == "x"
+    finally:
+        conn.close()
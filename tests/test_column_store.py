@@ -0,0 +1,52 @@
+import numpy as np
+
+from logic.column_store import ColumnStore
+from logic.formulas import FUNCTIONS, RangeValue
+
+from test_formulas import evaluate
+
+
+def test_range_value_exposes_numbers_and_text():
+    store = ColumnStore.from_cells([1, 2, 3, 1], [1, 1, 1, 2], [1.5, "a", 2, "b"])
+    numbers, mask = store.get_range("A1:B3").numeric()
+    assert mask.tolist() == [[True, False], [False, False], [True, False]]
+    assert numbers.sum() == 3.5
+    codes, pool = store.get_range("A1:B3").text_codes()
+    assert [pool[c] for c in codes.ravel(order="C")] == [None, "b", "a", None, None, None]
+    assert store.get_range("A1:B2").rows == [[1.5, "b"], ["a", None]]
+
+
+def test_ranges_grow_with_the_cells_set():
+    store = ColumnStore()
+    store.set(3, 2, 4.0)
+    assert store.shape == (3, 2)
+    assert FUNCTIONS["SUM"].func(store.get_range("A1:C5")) == 4.0
+    store.set(3, 2, None)
+    assert FUNCTIONS["SUM"].func(store.get_range("A1:C5")) == 0
+
+
+def test_ranges_with_booleans_and_errors_use_the_cell_values():
+    store = ColumnStore.from_cells([1, 2, 3, 4], [1, 1, 1, 1], [1.0, True, "#N/A", 2.0])
+    rows = store.get_range("A1:A4").rows
+    assert rows == [[1.0], [True], ["#N/A"], [2.0]]
+    assert store.get_range("A1:A4").number_mask().ravel().tolist() == [True, False, False, True]
+
+
+def test_count_skips_error_cells():
+    cells = {"A1": "1", "A2": "=1/0", "A3": "2", "A4": "=1>0", "A5": "x"}
+    assert evaluate("=COUNT(A1:A5)", **cells) == 2
+    assert evaluate("=COUNT(A1:A5, 3)", **cells) == 3
+    assert FUNCTIONS["COUNT"].func(RangeValue(rows=[[1, "#N/A", True, 2.5]])) == 2
+
+
+def test_other_aggregates_return_the_error():
+    cells = {"A1": "1", "A2": "=1/0", "A3": "2"}
+    for name in ("SUM", "AVERAGE", "MIN", "MAX"):
+        assert evaluate(f"={name}(A1:A3)", **cells) == "#DIV/0!"
+
+
+def test_booleans_in_ranges_are_ignored_by_aggregates():
+    cells = {"A1": "1", "A2": "=1>0", "A3": "2"}
+    assert evaluate("=SUM(A1:A3)", **cells) == 3
+    assert evaluate("=AVERAGE(A1:A3)", **cells) == 1.5
+    assert np.isclose(evaluate("=SUMPRODUCT(A1:A3, A1:A3)", **cells), 5)
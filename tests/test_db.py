@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from logic import db
+from logic.migrations import MIGRATIONS, schema_version
+
+
+def count(table, where="1", params=()):
+    return db.get_conn().execute(f"SELECT count(*) FROM {table} WHERE {where}", params).fetchone()[0]
+
+
+def test_connections_are_per_thread_and_migrated():
+    conn = db.get_conn()
+    assert db.get_conn() is conn
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    other = []
+    thread = threading.Thread(target=lambda: (other.append(db.get_conn()), db.close_conn()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_batch_keeps_the_newest_rating_per_project():
+    project = db.add_project("batch", "car", "M1", "tester")
+    futures = [Future() for _ in range(5)]
+    db._write_batch([
+        ("rating", (project, 1.0, "first", ""), futures[0]),
+        ("project", ("batch 2", "car", "M1", "tester"), futures[1]),
+        ("ratings", [(project, 2.0, "second", ""), (project + 1000, 5.0, "other", "")], futures[2]),
+        ("rating", (project, 3.0, "third", ""), futures[3]),
+        ("flush", None, futures[4]),
+    ])
+    assert futures[0].result() is None and futures[3].result() is None
+    assert futures[1].result() == project + 1
+    assert futures[2].result() == 2
+    assert futures[4].result() is None
+    assert count("project_ratings", "project_id=?", (project,)) == 1
+    assert db.get_latest_project_rating(project)["status"] == "third"
+    assert db.get_latest_ratings()[project + 1000]["status"] == "other"
+
+
+def test_failed_batch_is_rolled_back_and_reported_to_every_caller():
+    before = count("projects")
+    good, bad, rating = Future(), Future(), Future()
+    db._write_batch([
+        ("project", ("kept?", "car", "M1", "tester"), good),
+        ("project", ("missing", "params"), bad),
+        ("rating", (1, 1.0, "lost", ""), rating),
+    ])
+    for future in (good, bad, rating):
+        with pytest.raises(sqlite3.ProgrammingError):
+            future.result()
+    assert count("projects") == before
+
+
+def test_writer_thread_propagates_errors_and_keeps_running():
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.submit_write("project", ("missing", "params")).result(timeout=10)
+    project = db.add_project("after error", "car", "M2", "tester")
+    futures = [db.save_project_rating(project, score, f"s{score}", "") for score in range(20)]
+    db.flush_writes()
+    assert all(future.done() and future.exception() is None for future in futures)
+    assert db.get_project_details(project)["name"] == "after error"
+    assert db.get_latest_project_rating(project)["status"] == "s19"
+    assert db.save_project_ratings([(project, 99.0, "bulk", "")]).result(timeout=10) == 1
+    assert db.get_latest_ratings()[project]["drivability_score"] == 99.0
@@ -0,0 +1,70 @@
+import pytest
+
+from logic.excel_app import SheetContext, evaluate_formula
+from logic.formulas import CellRef, FormulaSyntaxError, RangeRef, compile_formula
+
+
+def evaluate(formula, **cells):
+    """Result of ``formula`` on a sheet holding ``cells`` (e.g. ``A1="2"``)."""
+    context = SheetContext({ref: {"value": value} for ref, value in cells.items()})
+    return evaluate_formula(formula, context, "Z99")
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=1+2*3", 7),
+    ("=(1+2)*3", 9),
+    ("=2^3", 8),
+    ("=-A1+A2", 1),
+    ("=A1&\"-\"&A2", "2-3"),
+    ("=A1<A2", True),
+    ("=IF(A1>5,\"big\",\"small\")", "small"),
+    ("=ROUND(A2/A1, 1)", 1.5),
+    ("=Z1", 0),
+])
+def test_evaluates_expressions(formula, expected):
+    assert evaluate(formula, A1="2", A2="3") == expected
+
+
+def test_range_aggregates():
+    cells = {"A1": "1", "A2": "2", "A3": "text", "A4": "", "B1": "4"}
+    assert evaluate("=SUM(A1:B4)", **cells) == 7
+    assert evaluate("=AVERAGE(A1:A4)", **cells) == 1.5
+    assert evaluate("=MIN(A1:B4)", **cells) == 1
+    assert evaluate("=MAX(A1:B4)", **cells) == 4
+    assert evaluate("=COUNT(A1:B4)", **cells) == 3
+    assert evaluate("=COUNTA(A1:A4)", **cells) == 3
+
+
+def test_formulas_read_other_formulas():
+    assert evaluate("=A3*2", A1="1", A2="2", A3="=SUM(A1:A2)") == 6
+
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=1/0", "#DIV/0!"),
+    ("=A1+1", "#DIV/0!"),
+    ("=SUM(A1:A2)", "#DIV/0!"),
+    ("=IF(A2>0, A1, 0)", "#DIV/0!"),
+    ("=\"a\"+1", "#VALUE!"),
+    ("=NOSUCHFUNCTION(1)", "#NAME?"),
+    ("=Other!A1", "#REF!"),
+])
+def test_errors_propagate(formula, expected):
+    assert evaluate(formula, A1="=1/0", A2="5") == expected
+
+
+def test_iferror_catches_errors():
+    assert evaluate("=IFERROR(A1, -1)", A1="=1/0") == -1
+    assert evaluate("=IFERROR(A2, -1)", A1="=1/0", A2="5") == 5
+
+
+def test_syntax_errors_are_reported():
+    assert evaluate("=1+").startswith("#ERROR")
+    with pytest.raises(FormulaSyntaxError):
+        compile_formula("=SUM(A1:A2")
+
+
+def test_compiled_formula_lists_its_references():
+    refs = compile_formula("=SUM(A1:B2)+Data!C3").refs
+    assert RangeRef(None, None, 1, 1, 2, 2) in refs
+    assert CellRef(None, "Data", 3, 3) in refs
+    assert compile_formula("=A1+1") is compile_formula("=A1+1")
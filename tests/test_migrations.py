@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from logic import migrations
+from logic.migrations import MIGRATIONS, migrate, schema_version
+
+
+@pytest.fixture
+def conn(baseline_db):
+    conn = sqlite3.connect(baseline_db)
+    yield conn
+    conn.close()
+
+
+def objects(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type=?", (kind,))}
+
+
+def test_upgrades_the_baseline_database(conn):
+    assert schema_version(conn) == 0
+    assert migrate(conn) == len(MIGRATIONS)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert {"idx_project_ratings_project_id", "idx_project_ratings_project_created"} <= objects(conn, "index")
+    assert {"project_latest_rating", "config_revision"} <= objects(conn, "table")
+    assert migrate(conn) == len(MIGRATIONS)
+
+
+def test_latest_rating_is_backfilled_and_kept_up_to_date(conn):
+    conn.executemany(
+        "INSERT INTO project_ratings (project_id, drivability_score, status) VALUES (?, ?, ?)",
+        [(901, 1.0, "old"), (901, 2.0, "new"), (902, 3.0, "only")],
+    )
+    conn.commit()
+    migrate(conn)
+    latest = "SELECT r.status FROM project_latest_rating l JOIN project_ratings r ON r.id = l.rating_id WHERE l.project_id=?"
+    assert conn.execute(latest, (901,)).fetchone() == ("new",)
+    conn.execute("INSERT INTO project_ratings (project_id, drivability_score, status) VALUES (902, 4.0, 'newer')")
+    assert conn.execute(latest, (902,)).fetchone() == ("newer",)
+
+
+def test_config_changes_bump_the_revision(conn):
+    migrate(conn)
+    revision = "SELECT revision FROM config_revision"
+    before = conn.execute(revision).fetchone()[0]
+    conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('test-key', '1')")
+    conn.execute("UPDATE config SET value='2' WHERE key='test-key'")
+    conn.execute("DELETE FROM config WHERE key='test-key'")
+    assert conn.execute(revision).fetchone()[0] == before + 3
+
+
+def test_failed_migration_is_rolled_back(conn, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:1] + ["CREATE TABLE broken (;"])
+    with pytest.raises(sqlite3.Error):
+        migrations.migrate(conn)
+    assert schema_version(conn) == 1
+    assert "broken" not in objects(conn, "table")
@@ -0,0 +1,50 @@
+from logic.excel_app import recalculate
+from logic.recalc import DependencyGraph
+
+
+def sheet(**cells):
+    return {ref: {"value": value} for ref, value in cells.items()}
+
+
+def results(cell_data):
+    return {ref: entry["result"] for ref, entry in cell_data.items() if "result" in entry}
+
+
+def test_recalculates_in_dependency_order():
+    cell_data = sheet(A1="2", B1="=C1*10", C1="=A1+1", D1="=SUM(B1:C1)")
+    assert recalculate(cell_data) == {"B1", "C1", "D1"}
+    assert results(cell_data) == {"B1": 30, "C1": 3, "D1": 33}
+
+
+def test_recalculates_only_downstream_of_a_change():
+    cell_data = sheet(A1="2", A2="5", B1="=A1*2", B2="=A2*2", C1="=B1+1")
+    recalculate(cell_data)
+    cell_data["A1"]["value"] = "4"
+    assert recalculate(cell_data, {"A1"}) == {"B1", "C1"}
+    assert results(cell_data) == {"B1": 8, "B2": 10, "C1": 9}
+
+
+def test_cycles_are_marked():
+    cell_data = sheet(A1="=B1+1", B1="=A1+1", C1="=A1*2", D1="7", E1="=D1")
+    recalculate(cell_data)
+    assert results(cell_data) == {"A1": "#CYCLE!", "B1": "#CYCLE!", "C1": "#CYCLE!", "E1": 7}
+
+
+def test_self_reference_is_a_cycle():
+    cell_data = sheet(A1="=A1+1")
+    recalculate(cell_data)
+    assert cell_data["A1"]["result"] == "#CYCLE!"
+
+
+def test_graph_orders_and_finds_cycles():
+    graph = DependencyGraph()
+    graph.set_precedents("B1", {"A1"})
+    graph.set_precedents("C1", {"B1"})
+    graph.set_precedents("X1", {"Y1"})
+    graph.set_precedents("Y1", {"X1"})
+    assert graph.downstream({"A1"}) == {"A1", "B1", "C1"}
+    order, cyclic = graph.recalc_order({"C1", "B1", "X1", "Y1"})
+    assert order == ["B1", "C1"]
+    assert set(cyclic) == {"X1", "Y1"}
+    graph.discard("C1")
+    assert graph.downstream({"A1"}) == {"A1", "B1"}
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from logic.sheet_cache import load_sheet
+from logic.sheet_query import (
+    parse_filter_query, query_sheet_rows, query_sheet_window, query_table_page, sql_order_by,
+)
+
+from test_workbook import write_sheets
+
+
+def test_parse_filter_query():
+    conditions = parse_filter_query(
+        '{A} contains 5 && {B} > 6 && {C} ieq "Y" && {D} is not blank && garbage && {E} = 2'
+    )
+    assert [(c.column, c.operator, c.value, c.case_sensitive) for c in conditions] == [
+        ("A", "contains", "5", True),
+        ("B", "gt", 6.0, True),
+        ("C", "eq", "Y", False),
+        ("D", "is not blank", None, True),
+        ("E", "eq", 2.0, True),
+    ]
+    assert parse_filter_query(None) == []
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    write_sheets(tmp_path, {"Data": {
+        "A1": 5, "B1": "x",
+        "A2": 15, "B2": "Y",
+        "A3": "a5b", "B3": "y",
+        "A4": 7,
+    }})
+    return load_sheet(str(tmp_path / "Data.json"))
+
+
+@pytest.mark.parametrize("filter_query, expected", [
+    ("{A} contains 5", [0, 1, 2]),
+    ("{A} > 6", [1, 3]),
+    ("{A} <= 7", [0, 3]),
+    ("{A} = 15", [1]),
+    ("{B} eq y", [2]),
+    ("{B} ieq y", [1, 2]),
+    ("{B} is blank", [3]),
+    ("{A} contains 5 && {B} icontains Y", [1, 2]),
+    ("{ZZ} eq 1", []),
+    ("{ZZ} is blank", [0, 1, 2, 3]),
+    ("{not a column} contains 5", []),
+])
+def test_filters_sheet_rows(sheet, filter_query, expected):
+    assert query_sheet_rows(sheet, filter_query) == expected
+
+
+def test_sorts_sheet_rows(sheet):
+    assert query_sheet_rows(sheet, sort_by=[{"column_id": "A", "direction": "asc"}]) == [0, 3, 1, 2]
+    assert query_sheet_rows(sheet, sort_by=[{"column_id": "A", "direction": "desc"}]) == [2, 1, 3, 0]
+    assert query_sheet_rows(sheet, sort_by=[{"column_id": "ZZ", "direction": "asc"}]) == [0, 1, 2, 3]
+
+
+def test_pages_sheet_rows(sheet):
+    letters, records, page_count = query_sheet_window(
+        sheet, page_current=1, page_size=1, filter_query="{A} > 6", sort_by=[{"column_id": "A"}]
+    )
+    assert letters == ["A", "B"]
+    assert records == [{"Row": "2", "A": 15, "B": "Y"}]
+    assert page_count == 2
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE scores (name TEXT, score REAL)")
+    conn.executemany(
+        "INSERT INTO scores VALUES (?, ?)", [("a5", 1.0), ("b", 15.0), ("c", None), ("A50", 7.0)]
+    )
+    yield conn
+    conn.close()
+
+
+def names(records):
+    return [record["name"] for record in records]
+
+
+@pytest.mark.parametrize("filter_query, expected", [
+    ("{name} contains 5", ["a5", "A50"]),
+    ("{name} contains a", ["a5"]),
+    ("{name} icontains a", ["a5", "A50"]),
+    ("{score} > 5", ["b", "A50"]),
+    ("{score} is blank", ["c"]),
+    ('{name} contains "5%"', []),
+    ("{nope} eq 1", []),
+    ("{nope} is blank", ["a5", "b", "c", "A50"]),
+])
+def test_filters_table_rows(conn, filter_query, expected):
+    records, _ = query_table_page(conn, "scores", filter_query=filter_query)
+    assert names(records) == expected
+
+
+def test_sorts_and_pages_table_rows(conn):
+    records, page_count = query_table_page(
+        conn, "scores", page_current=0, page_size=2,
+        sort_by=[{"column_id": "nope"}, {"column_id": "score", "direction": "desc"}],
+    )
+    assert names(records) == ["b", "A50"]
+    assert page_count == 2
+    assert sql_order_by([{"column_id": "nope"}], {"name", "score"}) == ""
+    assert sql_order_by([{"column_id": 'we"ird'}]) == ' ORDER BY "we""ird" ASC'
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from logic.workbook import Workbook
+
+
+def write_sheets(folder, sheets):
+    """Write ``{sheet: {address: value or "=formula"}}`` as JSON sheet exports."""
+    for name, cells in sheets.items():
+        data = {"cells": {
+            address: {
+                "value": None if isinstance(value, str) and value.startswith("=") else value,
+                "formula": value if isinstance(value, str) and value.startswith("=") else None,
+                "namedRange": None,
+            }
+            for address, value in cells.items()
+        }}
+        (folder / f"{name}.json").write_text(json.dumps(data), encoding="utf-8")
+    return folder
+
+
+@pytest.fixture
+def book(tmp_path):
+    write_sheets(tmp_path, {
+        "Data": {"A1": 1, "A2": 2, "A3": 3, "B1": "=A1*10"},
+        "Summary": {
+            "A1": "=SUM(Data!A1:A3)",
+            "A2": "=A1+Data!B1",
+            "A3": "=SUM(VALUES)",
+            "A4": "=COUNT('Data'!A1:B3)",
+        },
+    })
+    book = Workbook.load(tmp_path, names={"Values": "Data!A1:A3"})
+    book.recalculate()
+    return book
+
+
+def test_resolves_references_across_sheets(book):
+    assert book.get("Summary!A1:A4") == [[6], [16], [6], [4]]
+    assert book.get("A1", default_sheet="Data") == 1
+
+
+def test_literal_edit_recalculates_range_readers(book):
+    changed = book.set_cell("Data", "A1", 10)
+    dirty = book.recalculate([changed])
+    assert dirty == {("Summary", 1, 1), ("Summary", 2, 1), ("Summary", 3, 1),
+                     ("Summary", 4, 1), ("Data", 1, 2)}
+    assert book.get("Summary!A1:A4") == [[15], [115], [15], [4]]
+
+
+def test_cleared_and_new_cells_reach_range_readers(book):
+    book.recalculate([book.set_cell("Data", "A2", None)])
+    assert book.get("Summary!A1") == 4
+    assert book.get("Summary!A4") == 3
+    book.recalculate([book.set_cell("Data", "A2", "=A3*2")])
+    assert book.get("Summary!A1") == 10
+    assert book.get("Summary!A4") == 4
+
+
+def test_new_formula_is_recalculated(book):
+    book.recalculate([book.set_cell("Summary", "B1", "=A1/Data!A2")])
+    assert book.get("Summary!B1") == 3
+
+
+def test_cross_sheet_cycles_and_errors(tmp_path):
+    write_sheets(tmp_path, {
+        "One": {"A1": "=Two!A1+1", "B1": "=1/0", "C1": "=Missing!A1"},
+        "Two": {"A1": "=One!A1+1", "B1": "=One!B1*2", "C1": "=IFERROR(One!B1, 0)"},
+    })
+    book = Workbook.load(tmp_path)
+    book.recalculate()
+    assert book.get("One!A1") == "#CYCLE!"
+    assert book.get("Two!A1") == "#CYCLE!"
+    assert book.get("One!C1") == "#REF!"
+    assert book.get("Two!B1:C1") == [["#DIV/0!", 0]]
+
+
+def test_unknown_sheet_raises(book):
+    with pytest.raises(KeyError):
+        book.get("Nowhere!A1")
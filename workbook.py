@@ -0,0 +1,454 @@
+"""
+Workbook formula engine
+=======================
+
+Loads every JSON sheet export of a folder into one address space keyed by
+``(sheet, row, col)`` and evaluates the formulas of all sheets together:
+``=SUM(G13:I13)`` reads its own sheet, ``=RATING!AK18`` another sheet, and
+external references such as ``=[1]Résultats!B2`` are resolved against the
+workbook registered for that index (by default the exported workbook itself,
+since the exports come from the book the links point to).
+
+Formulas are compiled once (``formulas.compile_formula``), their precedents
+are tracked in a ``recalc.DependencyGraph`` and ``recalculate`` evaluates them
+in dependency order, so every formula runs once and after all of its inputs.
+Ranges are not expanded into the graph: each (sheet, column) lists the row
+spans that formulas read, so an edit to a literal inside a range still
+reaches the formulas reading it.
+Sheets come from the compiled sheet cache (``sheet_cache.load_sheets``), so
+building a workbook does not re-parse unchanged JSON files.
+
+Usage::
+
+    python -m logic.workbook <json_dir> [Sheet!A1 ...]
+"""
+
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from logic.cell_store import parse_reference
+from logic.column_store import ColumnStore
+from logic.formulas import (
+    CellRef, RangeRef, NameRef, FormulaError, FormulaSyntaxError, ERROR_CODES,
+    compile_formula,
+)
+from logic.recalc import CYCLE_ERROR, DependencyGraph
+from logic.a1 import split_address
+from logic.sheet_cache import load_sheets
+from logic import summary_cells  # noqa: F401  (registers powerSummCells / calculSummCells)
+
+
+class _SheetContext:
+    """Evaluation context of the formulas of one sheet (unqualified refs resolve there)."""
+
+    __slots__ = ("book", "sheet", "caller")
+
+    def __init__(self, book, sheet):
+        self.book = book
+        self.sheet = sheet
+        self.caller = None
+
+    def cell(self, ref):
+        book, sheet = self.book.resolve_sheet(ref, self.sheet)
+        return book.value(sheet, ref.row, ref.col)
+
+    def range(self, ref):
+        book, sheet = self.book.resolve_sheet(ref, self.sheet)
+        return book.range_value(sheet, ref.row1, ref.col1, ref.row2, ref.col2)
+
+    def memo(self, ref):
+        """Memo dict of the sheet read by ``ref``, emptied whenever the workbook data changes."""
+        book, sheet = self.book.resolve_sheet(ref, self.sheet)
+        return book.sheet_memo(sheet)
+
+    def name(self, ref):
+        book, target = self.book.resolve_name(ref, self.sheet)
+        if not isinstance(target, tuple):
+            return target
+        sheet, r1, c1, r2, c2 = target
+        if (r1, c1) == (r2, c2):
+            return book.value(sheet, r1, c1)
+        return book.range_value(sheet, r1, c1, r2, c2)
+
+
+class Workbook:
+    """All sheets of a workbook with their formulas, evaluated across sheets.
+
+    ``values`` maps ``(sheet, row, col)`` to the literal value of the
+    non-formula cells, ``formulas`` maps the formula cells to their text and
+    ``results`` holds the computed formula results (error codes as strings).
+    ``names`` maps a defined name (``"GLOBALPUISS"`` or ``"HOME!Project"``) to
+    a reference such as ``"Graph_status!B2"`` or to a constant. ``external``
+    maps the ``[n]`` index of external references to another Workbook.
+    """
+
+    def __init__(self, sheets, names=None, external=None):
+        self.sheet_names = []
+        self.values = {}
+        self.formulas = {}
+        self.results = {}
+        self.names = {key.upper(): value for key, value in (names or {}).items()}
+        self.external = dict(external or {})
+        self.graph = None
+        self._range_readers = {}  # (sheet, col) -> [(row1, row2, formula key)]
+        self._ranges_read = {}  # formula key -> [(sheet, row1, col1, row2, col2)]
+        self._formula_cells = {}  # sheet -> sorted [(row, col)] of formula cells
+        self._columns = {}  # sheet -> ColumnStore, built when a range is first read
+        self._memos = {}  # sheet -> derived data of formula functions (see sheet_memo)
+        self._contexts = {}
+        self._visiting = set()
+        for name, sheet in sheets:
+            self.sheet_names.append(name)
+            self._contexts[name] = _SheetContext(self, name)
+            positions = []
+            for row, col, value, formula in sheet.iter_cells():
+                if formula:
+                    self.formulas[(name, row, col)] = formula
+                    positions.append((row, col))
+                elif value is not None:
+                    self.values[(name, row, col)] = value
+            self._formula_cells[name] = sorted(positions)
+
+    @classmethod
+    def load(cls, json_dir, names=None, external=None):
+        """Build a workbook from the JSON sheet exports of a folder."""
+        return cls(load_sheets(json_dir), names=names, external=external)
+
+    # --- Reference resolution ------------------------------------------------
+
+    def _book(self, index):
+        if index is None:
+            return self
+        return self.external.get(index, self)
+
+    def resolve_sheet(self, ref, current_sheet):
+        """Return ``(workbook, sheet)`` read by a CellRef/RangeRef, raising #REF! when it does not exist.
+
+        ``[n]Sheet!A1`` references are read from the workbook registered as
+        ``external[n]``.
+        """
+        book = self._book(ref.book)
+        sheet = current_sheet if ref.sheet is None else ref.sheet
+        if sheet not in book._contexts:
+            raise FormulaError("#REF!", f"Unknown sheet {sheet!r}")
+        return book, sheet
+
+    def resolve_name(self, ref, current_sheet):
+        """Return ``(workbook, target)`` for a NameRef.
+
+        ``target`` is a ``(sheet, r1, c1, r2, c2)`` tuple for names that
+        point at cells, or the constant value of the name.
+        """
+        book = self._book(ref.book)
+        sheet = ref.sheet or current_sheet
+        for key in (f"{sheet}!{ref.name}".upper(), ref.name.upper()):
+            if key in book.names:
+                target = book.names[key]
+                break
+        else:
+            raise FormulaError("#NAME?", f"Unknown name {ref.name}")
+        if isinstance(target, str):
+            try:
+                return book, parse_reference(target, default_sheet=sheet)
+            except ValueError:
+                pass
+        return book, target
+
+    # --- Values --------------------------------------------------------------
+
+    def value(self, sheet, row, col):
+        """Value of one cell; formula cells are evaluated on demand (memoized)."""
+        key = (sheet, row, col)
+        if key not in self.formulas:
+            return self.values.get(key)
+        if key in self.results:
+            result = self.results[key]
+        else:
+            if key in self._visiting:
+                raise FormulaError(CYCLE_ERROR)
+            self._visiting.add(key)
+            try:
+                result = self._evaluate(key)
+            finally:
+                self._visiting.discard(key)
+            self._store(key, result)
+        # Errors propagate to the formulas that read them
+        if isinstance(result, str) and result in ERROR_CODES:
+            raise FormulaError(result)
+        return result
+
+    def range_value(self, sheet, row1, col1, row2, col2):
+        """RangeValue of a rectangle, backed by the sheet's column arrays."""
+        for row, col in self._formulas_in(sheet, row1, col1, row2, col2):
+            if (sheet, row, col) not in self.results:
+                try:
+                    self.value(sheet, row, col)
+                except FormulaError:
+                    pass
+
+        def load_rows():
+            return [
+                [self.value(sheet, row, col) for col in range(col1, col2 + 1)]
+                for row in range(row1, row2 + 1)
+            ]
+
+        return self._column_store(sheet).range_value(row1, col1, row2, col2, load_rows)
+
+    def sheet_memo(self, sheet):
+        """Scratch dict where formula functions keep data derived from a sheet.
+
+        Valid until the next ``set_cell`` or ``recalculate``, which empty it.
+        """
+        memo = self._memos.get(sheet)
+        if memo is None:
+            memo = self._memos[sheet] = {}
+        return memo
+
+    def _column_store(self, sheet):
+        store = self._columns.get(sheet)
+        if store is None:
+            store = self._columns[sheet] = ColumnStore()
+            for (name, row, col), value in self.values.items():
+                if name == sheet:
+                    store.set(row, col, value)
+            for (name, row, col), result in self.results.items():
+                if name == sheet:
+                    store.set(row, col, result)
+        return store
+
+    def _formulas_in(self, sheet, row1, col1, row2, col2):
+        positions = self._formula_cells.get(sheet, ())
+        start = bisect_left(positions, (row1, 0))
+        end = bisect_right(positions, (row2, sys.maxsize))
+        return [(row, col) for row, col in positions[start:end] if col1 <= col <= col2]
+
+    def _evaluate(self, key):
+        sheet, row, col = key
+        context = self._contexts[sheet]
+        previous, context.caller = context.caller, CellRef(None, None, row, col)
+        try:
+            return compile_formula(self.formulas[key]).evaluate(context)
+        except FormulaError as e:
+            return e.code
+        except FormulaSyntaxError:
+            return "#NAME?"
+        except RecursionError:
+            return CYCLE_ERROR
+        finally:
+            context.caller = previous
+
+    def _store(self, key, result):
+        self.results[key] = result
+        store = self._columns.get(key[0])
+        if store is not None:
+            store.set(key[1], key[2], result)
+
+    # --- Dependency graph ----------------------------------------------------
+
+    def ranges_read(self, key):
+        """Rectangles ``(sheet, row1, col1, row2, col2)`` of this workbook read by the formula at ``key``."""
+        sheet = key[0]
+        try:
+            compiled = compile_formula(self.formulas[key])
+        except FormulaSyntaxError:
+            return []
+        found = []
+        for ref in compiled.refs:
+            try:
+                if isinstance(ref, RangeRef):
+                    book, target = self.resolve_sheet(ref, sheet)
+                    if book is self:
+                        found.append((target, ref.row1, ref.col1, ref.row2, ref.col2))
+                elif isinstance(ref, NameRef):
+                    book, target = self.resolve_name(ref, sheet)
+                    if book is self and isinstance(target, tuple):
+                        found.append(target)
+            except FormulaError:
+                continue
+        return found
+
+    def _set_range_reader(self, key):
+        for sheet, row1, col1, row2, col2 in self._ranges_read.pop(key, ()):
+            for col in range(col1, col2 + 1):
+                readers = self._range_readers.get((sheet, col))
+                if readers is not None:
+                    readers.remove((row1, row2, key))
+        if key not in self.formulas:
+            return
+        rectangles = self.ranges_read(key)
+        if rectangles:
+            self._ranges_read[key] = rectangles
+            for sheet, row1, col1, row2, col2 in rectangles:
+                for col in range(col1, col2 + 1):
+                    self._range_readers.setdefault((sheet, col), []).append((row1, row2, key))
+
+    def range_readers(self, key):
+        """Formula cells with a range (or range name) covering the cell ``key``."""
+        sheet, row, col = key
+        return {
+            reader for row1, row2, reader in self._range_readers.get((sheet, col), ())
+            if row1 <= row <= row2
+        }
+
+    def precedents(self, key):
+        """Cells read by the formula at ``key``: its single-cell refs and the formula cells of its ranges.
+
+        Literal cells inside ranges are reached through ``range_readers``.
+        """
+        sheet = key[0]
+        try:
+            compiled = compile_formula(self.formulas[key])
+        except FormulaSyntaxError:
+            return set()
+        found = set()
+        for ref in compiled.refs:
+            try:
+                if isinstance(ref, CellRef):
+                    book, target = self.resolve_sheet(ref, sheet)
+                    if book is self:
+                        found.add((target, ref.row, ref.col))
+                elif isinstance(ref, RangeRef):
+                    book, target = self.resolve_sheet(ref, sheet)
+                    if book is self:
+                        found.update(
+                            (target, row, col)
+                            for row, col in self._formulas_in(target, ref.row1, ref.col1, ref.row2, ref.col2)
+                        )
+                elif isinstance(ref, NameRef):
+                    book, target = self.resolve_name(ref, sheet)
+                    if book is self and isinstance(target, tuple):
+                        found.update(
+                            (target[0], row, col) for row, col in self._formulas_in(*target)
+                        )
+            except FormulaError:
+                continue  # reported when the formula is evaluated
+        return found
+
+    def build_graph(self):
+        graph = DependencyGraph()
+        self._range_readers = {}
+        self._ranges_read = {}
+        for key in self.formulas:
+            graph.set_precedents(key, self.precedents(key))
+            self._set_range_reader(key)
+        self.graph = graph
+        return graph
+
+    def volatile_cells(self):
+        """Formula cells that must be recalculated on every pass (NOW() ...)."""
+        volatile = set()
+        for key, text in self.formulas.items():
+            try:
+                if compile_formula(text).volatile:
+                    volatile.add(key)
+            except FormulaSyntaxError:
+                continue
+        return volatile
+
+    # --- Recalculation -------------------------------------------------------
+
+    def set_cell(self, sheet, address, value):
+        """Change one cell (``value`` starting with ``=`` makes it a formula).
+
+        Returns the cell key, to be passed to ``recalculate``.
+        """
+        if sheet not in self._contexts:
+            raise KeyError(sheet)
+        row, col = split_address(address)
+        key = (sheet, row, col)
+        self._memos.clear()
+        positions = self._formula_cells[sheet]
+        was_formula = key in self.formulas
+        self.results.pop(key, None)
+        if isinstance(value, str) and value.startswith("="):
+            self.values.pop(key, None)
+            self.formulas[key] = value
+            if not was_formula:
+                positions.insert(bisect_left(positions, (row, col)), (row, col))
+        else:
+            self.formulas.pop(key, None)
+            if was_formula:
+                positions.remove((row, col))
+            if value is None or value == "":
+                self.values.pop(key, None)
+            else:
+                self.values[key] = value
+        store = self._columns.get(sheet)
+        if store is not None:
+            store.set(row, col, self.values.get(key))
+        if self.graph is not None:
+            if key in self.formulas:
+                self.graph.set_precedents(key, self.precedents(key))
+            else:
+                self.graph.discard(key)
+            self._set_range_reader(key)
+            if was_formula != (key in self.formulas):
+                self.graph = None  # range precedents of other formulas changed
+        return key
+
+    def recalculate(self, changed=None, timings=None):
+        """Recalculate the formulas downstream of ``changed`` keys (all of them when None).
+
+        Volatile formulas are always included. When a ``timings`` dict is
+        given, the evaluation time is added up in it per sheet. Returns the
+        recalculated keys.
+        """
+        graph = self.graph or self.build_graph()
+        self._memos.clear()
+        if changed is None:
+            dirty = set(self.formulas)
+        else:
+            changed = set(changed)
+            for key in list(changed):
+                changed.update(self.range_readers(key))
+            dirty = graph.downstream(changed) | graph.downstream(self.volatile_cells())
+        dirty = {key for key in dirty if key in self.formulas}
+        for key in dirty:
+            self.results.pop(key, None)
+        order, cyclic = graph.recalc_order(dirty)
+        for key in cyclic:
+            self._store(key, CYCLE_ERROR)
+        for key in order:
+            if key not in self.results:
+                if timings is None:
+                    self._store(key, self._evaluate(key))
+                else:
+                    start = time.perf_counter()
+                    self._store(key, self._evaluate(key))
+                    timings[key[0]] = timings.get(key[0], 0.0) + time.perf_counter() - start
+        return dirty
+
+    def get(self, reference, default_sheet=None):
+        """Value of ``Sheet!A1`` (formula cells show their result), or a range as rows."""
+        sheet, r1, c1, r2, c2 = parse_reference(reference, default_sheet)
+        if sheet not in self._contexts:
+            raise KeyError(sheet)
+
+        def shown(row, col):
+            key = (sheet, row, col)
+            if key in self.formulas:
+                if key not in self.results:
+                    self._store(key, self._evaluate(key))
+                return self.results[key]
+            return self.values.get(key)
+
+        if (r1, c1) == (r2, c2):
+            return shown(r1, c1)
+        return [[shown(row, col) for col in range(c1, c2 + 1)] for row in range(r1, r2 + 1)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m logic.workbook <json_dir> [Sheet!A1 ...]")
+        sys.exit(1)
+    start = time.perf_counter()
+    book = Workbook.load(sys.argv[1])
+    loaded = time.perf_counter()
+    book.recalculate()
+    done = time.perf_counter()
+    errors = sum(1 for r in book.results.values() if isinstance(r, str) and r in ERROR_CODES)
+    print(f"Loaded {len(book.sheet_names)} sheets in {loaded - start:.3f}s")
+    print(f"Recalculated {len(book.formulas)} formulas in {done - loaded:.3f}s ({errors} errors)")
+    for reference in sys.argv[2:]:
+        print(f"{reference} = {book.get(reference)!r}")
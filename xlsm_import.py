@@ -0,0 +1,311 @@
+"""
+Parallel workbook import
+========================
+
+Reads every sheet of the ``.xlsm`` workbook with openpyxl in read-only
+(streaming) mode, one worker process per sheet, so a full import scales with
+the number of cores. Each worker writes its rows in ``IMPORT_BATCH_SIZE``
+batches to a private SQLite file in a temporary folder. It can also rewrite
+the sheet's JSON export (``{"cells": {...}}``, non-empty cells only). The
+main process then copies the sheet tables into the database, again batch by
+batch. Memory stays bounded by the batch size, whatever the size of the
+workbook. Read-only mode does not see charts, so a rewritten export keeps
+the ``charts`` of the file it replaces.
+
+The first non-blank row of a sheet is its header, wherever it is. This
+deliberately differs from ``pd.read_excel``, which takes row 1 unless told
+``header=``, so a title block above the table does not become the columns.
+Blank rows are skipped, sheets without data rows get no table and column
+names follow pandas ("Unnamed: 3", "x.1").
+
+Usage::
+
+    python -m logic.xlsm_import <workbook> [db_path] [json_dir] [workers]
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import zip_longest
+
+from openpyxl import load_workbook
+
+from logic.a1 import column_letter
+from logic.sheet_query import quote_identifier
+from logic.sheet_stream import BATCH_SIZE, iter_batches
+
+IMPORT_BATCH_SIZE = BATCH_SIZE
+# One cell of a JSON export, laid out like json.dump(indent=2)
+_CELL_TEMPLATE = '{}    "{}": {{\n      "value": {},\n      "formula": {},\n      "namedRange": null\n    }}'
+_dumps = json.JSONEncoder(ensure_ascii=False).encode
+# Top-level "charts" key of an indented export (cell text cannot hold a raw newline)
+_CHARTS_KEY = '\n  "charts": '
+# Name of the single table of each worker's temporary database
+STAGING_TABLE = "sheet"
+
+
+def sheet_names(excel_path):
+    wb = load_workbook(excel_path, read_only=True, keep_links=False)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _iter_rows(excel_path, sheet_name, data_only=True):
+    wb = load_workbook(excel_path, read_only=True, data_only=data_only, keep_links=False)
+    try:
+        yield from wb[sheet_name].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _plain(value):
+    """Cell value as stored in SQLite / JSON (dates and times as text)."""
+    if isinstance(value, datetime.datetime):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    return value
+
+
+def _formula(value):
+    """Formula text of a cell read with ``data_only=False``, or None."""
+    if isinstance(value, str):
+        return value if value.startswith("=") else None
+    text = getattr(value, "text", None)  # ArrayFormula
+    return text if isinstance(text, str) else None
+
+
+def _column_names(header, start=0):
+    """Column names for a header row, the way pandas names them ("Unnamed: 3", "x.1")."""
+    names, seen = [], {}
+    for i, name in enumerate(header, start=start):
+        name = f"Unnamed: {i}" if name is None else str(_plain(name))
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        names.append(f"{name}.{count}" if count else name)
+    return names
+
+
+def _trimmed(row):
+    end = len(row)
+    while end and row[end - 1] is None:
+        end -= 1
+    return row[:end]
+
+
+def _existing_charts(path, chunk_size=1 << 20):
+    """The ``charts`` of the export at ``path`` ([] if none), found without loading its cells."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            tail = ""
+            for chunk in iter(lambda: f.read(chunk_size), ""):
+                text = tail + chunk
+                found = text.find(_CHARTS_KEY)
+                if found >= 0:
+                    rest = text[found + len(_CHARTS_KEY):] + f.read()
+                    return json.JSONDecoder().raw_decode(rest)[0]
+                tail = text[-len(_CHARTS_KEY):]
+    except (OSError, ValueError) as e:
+        print(f"Could not read the charts of {path}: {e}")
+    return []
+
+
+class _JsonExport:
+    """Writes a sheet export cell by cell, in the indented layout of the existing files."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.charts = _existing_charts(path)
+        self.f = open(self.tmp_path, "w", encoding="utf-8")
+        self.f.write('{\n  "cells": {')
+        self.first = True
+
+    def add(self, address, value, formula):
+        self.f.write(_CELL_TEMPLATE.format(
+            "\n" if self.first else ",\n", address,
+            _dumps(value), "null" if formula is None else _dumps(formula),
+        ))
+        self.first = False
+
+    def close(self):
+        charts = json.dumps(self.charts, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+        self.f.write(("\n  }" if not self.first else "}") + f',\n  "charts": {charts}\n}}')
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.f.close()
+        os.remove(self.tmp_path)
+
+
+def read_sheet(excel_path, sheet_name, staging_db, json_path=None, batch_size=IMPORT_BATCH_SIZE):
+    """Stream one sheet into ``staging_db`` (and ``json_path``); runs in a worker process.
+
+    Returns ``(sheet_name, row_count, sha1, seconds)``. ``row_count`` is None
+    when the sheet has no header or no data rows, and ``sha1`` hashes the
+    header and rows so unchanged sheets can be skipped.
+    """
+    start = time.perf_counter()
+    digest = hashlib.sha1()
+    values = _iter_rows(excel_path, sheet_name)
+    formulas = _iter_rows(excel_path, sheet_name, data_only=False) if json_path else ()
+    export = _JsonExport(json_path) if json_path else None
+    conn = sqlite3.connect(staging_db)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    state = {"columns": None, "row_count": 0, "created": False}
+
+    def data_rows():
+        for number, (row, formula_row) in enumerate(zip_longest(values, formulas, fillvalue=()), start=1):
+            if export:
+                for col, (value, formula) in enumerate(zip_longest(row, formula_row), start=1):
+                    formula = _formula(formula)
+                    if value is None and formula is None:
+                        continue
+                    value = formula if value is None else _plain(value)
+                    export.add(f"{column_letter(col)}{number}", value, formula)
+            row = _trimmed(tuple(_plain(value) for value in row))
+            if not row:
+                continue
+            digest.update(repr(row).encode("utf-8"))
+            columns = state["columns"]
+            if columns is None:
+                state["columns"] = _column_names(row)
+                continue
+            if len(row) > len(columns):
+                # Data beyond the header: extra unnamed columns, as pandas does.
+                for name in _column_names([None] * (len(row) - len(columns)), start=len(columns)):
+                    if state["created"]:
+                        conn.execute(f"ALTER TABLE {STAGING_TABLE} ADD COLUMN {quote_identifier(name)}")
+                    columns.append(name)
+            state["row_count"] += 1
+            yield row
+
+    try:
+        for batch in iter_batches(data_rows(), batch_size):
+            columns = state["columns"]
+            if not state["created"]:
+                conn.execute(f"CREATE TABLE {STAGING_TABLE} ({', '.join(map(quote_identifier, columns))})")
+                state["created"] = True
+            width = len(columns)
+            conn.executemany(
+                f"INSERT INTO {STAGING_TABLE} VALUES ({', '.join('?' * width)})",
+                (row + (None,) * (width - len(row)) for row in batch)
+            )
+            conn.commit()
+        if export:
+            export.close()
+    except BaseException:
+        if export:
+            export.abort()
+        raise
+    finally:
+        conn.close()
+    row_count = state["row_count"] if state["created"] else None
+    return sheet_name, row_count, digest.hexdigest(), time.perf_counter() - start
+
+
+def read_sheets(excel_path, staging_dir, json_dir=None, workers=None, names=None):
+    """Read the sheets of a workbook in parallel; return the ``read_sheet`` results in sheet order."""
+    names = list(names) if names is not None else sheet_names(excel_path)
+    if json_dir:
+        os.makedirs(json_dir, exist_ok=True)
+    jobs = [
+        (excel_path, name, os.path.join(staging_dir, f"{i}.db"),
+         os.path.join(json_dir, name + ".json") if json_dir else None)
+        for i, name in enumerate(names)
+    ]
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) if jobs else 1
+    if workers == 1:
+        results = [read_sheet(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(read_sheet, *job) for job in jobs]
+            for future in as_completed(futures):
+                future.result()  # surface worker errors early
+            results = [future.result() for future in futures]
+    return [(result, job[2]) for result, job in zip(results, jobs)]
+
+
+def copy_sheet_table(conn, sheet_name, staging_db, batch_size=IMPORT_BATCH_SIZE):
+    """Replace table ``sheet_name`` of ``conn`` with a worker's staged rows, batch by batch.
+
+    Does not commit: the caller decides the transaction.
+    """
+    source = sqlite3.connect(staging_db)
+    try:
+        cursor = source.execute(f"SELECT * FROM {STAGING_TABLE}")
+        columns = [description[0] for description in cursor.description]
+        quoted = quote_identifier(sheet_name)
+        conn.execute(f"DROP TABLE IF EXISTS {quoted}")
+        conn.execute(f"CREATE TABLE {quoted} ({', '.join(map(quote_identifier, columns))})")
+        insert = f"INSERT INTO {quoted} VALUES ({', '.join('?' * len(columns))})"
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            conn.executemany(insert, batch)
+    finally:
+        source.close()
+
+
+def import_workbook(excel_path, conn, json_dir=None, workers=None, skip=None):
+    """Import every sheet of ``excel_path`` into ``conn``.
+
+    Sheets whose content hash equals ``skip[sheet]`` are left as they are.
+    The tables are written without committing, so the caller can make the
+    whole import one transaction. Returns ``[(sheet, row_count, sha1, seconds)]``
+    for the tables written.
+    """
+    skip = skip or {}
+    imported = []
+    with tempfile.TemporaryDirectory(prefix="odriv-import-") as staging_dir:
+        for (sheet_name, row_count, sha1, seconds), staging_db in read_sheets(
+            excel_path, staging_dir, json_dir, workers
+        ):
+            if row_count is None:
+                print(f"Skipping empty or invalid sheet: {sheet_name}")
+                continue
+            if skip.get(sheet_name) == sha1:
+                continue
+            copy_sheet_table(conn, sheet_name, staging_db)
+            imported.append((sheet_name, row_count, sha1, seconds))
+    return imported
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m logic.xlsm_import <workbook> [db_path] [json_dir] [workers]")
+        sys.exit(1)
+    excel_path = sys.argv[1]
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "odriv.db"
+    json_dir = sys.argv[3] if len(sys.argv) > 3 else None
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else None
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN")
+        imported = import_workbook(excel_path, conn, json_dir, workers)
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    for sheet_name, row_count, _, seconds in imported:
+        print(f"{sheet_name}: {row_count} rows, read in {seconds:.3f}s")
+    print(f"Imported {len(imported)} sheets into {db_path} in {time.perf_counter() - start:.3f}s")